@@ -0,0 +1,119 @@
+import argparse
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely import STRtree
+
+from artefactos import cache_path, read_meta, source_version, tmp_path_for, write_meta
+from geometrias import CRS_METRICO, read_geometries
+from incremental import dataset_version, read_current
+
+
+AMENITIES = ('school', 'hospital')
+
+RADIOS = (500, 1000)
+
+# Lotes de anuncios por consulta para acotar la memoria de los pares (anuncio, servicio)
+BATCH_SIZE = 250_000
+
+CACHE_VERSION = 1
+
+
+def _project_points(df, lng_col='Lng', lat_col='Lat'):
+    points = gpd.GeoSeries(gpd.points_from_xy(df[lng_col], df[lat_col]), crs='EPSG:4326')
+    return np.asarray(points.to_crs(CRS_METRICO).values)
+
+
+def _nearest_distance(tree, points):
+    distances = np.full(len(points), np.nan, dtype=np.float32)
+    if len(tree.geometries) == 0:
+        return distances
+    for start in range(0, len(points), BATCH_SIZE):
+        batch = points[start:start + BATCH_SIZE]
+        (source, _), dist = tree.query_nearest(batch, return_distance=True, all_matches=False)
+        distances[start + source] = dist
+    return distances
+
+
+def _count_within(tree, points, radius):
+    counts = np.zeros(len(points), dtype=np.int32)
+    for start in range(0, len(points), BATCH_SIZE):
+        batch = points[start:start + BATCH_SIZE]
+        source, _ = tree.query(batch, predicate='dwithin', distance=radius)
+        counts[start:start + len(batch)] = np.bincount(source, minlength=len(batch))
+    return counts
+
+
+def accessibility_features(listados, metro_gdf, services_gdf):
+    """Distancias (m) al metro y a colegios/hospitales más cercanos, y recuentos por radio.
+
+    Todo se calcula en coordenadas proyectadas con STRtree de shapely, en bloque para toda la tabla.
+    """
+    points = _project_points(listados)
+    features = pd.DataFrame(index=listados.index)
+    if 'id' in listados.columns:
+        features['id'] = listados['id']
+
+    metro = np.asarray(metro_gdf.to_crs(CRS_METRICO).geometry.values)
+    features['dist_metro_m'] = _nearest_distance(STRtree(metro), points)
+
+    services = services_gdf.to_crs(CRS_METRICO)
+    for amenity in AMENITIES:
+        # Los edificios se reducen a su centroide: el árbol de puntos es más rápido que el de polígonos
+        selected = services.loc[services['amenity'] == amenity]
+        if 'centroid_x' in selected.columns:
+            # Centroides ya precalculados en la caché de geometrías (geometrias.py)
+            centroids = gpd.points_from_xy(selected['centroid_x'], selected['centroid_y'])
+        else:
+            centroids = selected.geometry.centroid.values
+        centroids = np.asarray(centroids)
+        tree = STRtree(centroids)
+        features[f'dist_{amenity}_m'] = _nearest_distance(tree, points)
+        for radius in RADIOS:
+            features[f'n_{amenity}_{radius}m'] = _count_within(tree, points, radius).astype(np.int16)
+    return features
+
+
+def accessibility_version(listados_path='precios_clean.csv', metro_path='beijing_metro.geojson',
+                          services_path='beijing_services.geojson'):
+    # Anuncios actuales (base más deltas) y capas de metro y servicios
+    return f'{dataset_version(listados_path)}:{source_version(metro_path, services_path)}'
+
+
+def read_accesibilidad(listados_path='precios_clean.csv', metro_path='beijing_metro.geojson',
+                       services_path='beijing_services.geojson', district=None):
+    """Columnas de accesibilidad de los anuncios actuales (incremental.read_current), persistidas en Parquet.
+
+    Con `district` solo se leen y calculan los anuncios de ese distrito (una partición del
+    almacén), con su propia caché.
+    """
+    name = 'accesibilidad' if district is None else f'accesibilidad-distrito-{district}'
+    parquet_path = cache_path('accesibilidad', f'{name}.parquet')
+    meta_path = cache_path('accesibilidad', f'{name}.meta.json')
+    version = accessibility_version(listados_path, metro_path, services_path)
+    meta = read_meta(meta_path)
+    if meta is not None and meta.get('version') == CACHE_VERSION and meta.get('sources') == version \
+            and os.path.exists(parquet_path):
+        return pd.read_parquet(parquet_path)
+
+    filters = None if district is None else [('district', '=', district)]
+    listados = read_current(listados_path, columns=['id', 'Lng', 'Lat'], filters=filters)
+    features = accessibility_features(listados, read_geometries(metro_path, projected=True),
+                                      read_geometries(services_path, projected=True))
+    tmp_path = tmp_path_for(parquet_path)
+    features.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, parquet_path)
+    write_meta(meta_path, {'version': CACHE_VERSION, 'sources': version, 'rows': len(features)})
+    return features
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calcula las variables de accesibilidad de cada anuncio.')
+    parser.add_argument('--listados', default='precios_clean.csv')
+    parser.add_argument('--metro', default='beijing_metro.geojson')
+    parser.add_argument('--services', default='beijing_services.geojson')
+    args = parser.parse_args()
+    features = read_accesibilidad(args.listados, args.metro, args.services)
+    print(features.describe().T)
@@ -0,0 +1,55 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from espacial import TILE_SIZE
+
+
+# Tamaño aproximado de cada celda en pantalla
+CELL_PIXELS = 24
+
+PERCENTILES = (0.25, 0.75, 0.9)
+
+
+def resolution_for_zoom(zoom):
+    # Se redondea el zoom para que zooms cercanos compartan la misma cuadrícula cacheada
+    return int(round(zoom))
+
+
+def cell_size(resolution, pixels=CELL_PIXELS):
+    return pixels * 360 / (TILE_SIZE * 2 ** resolution)
+
+
+def price_grid(df, resolution, lng_col='Lng', lat_col='Lat', price_col='price'):
+    """Agrega los anuncios en una cuadrícula regular con estadísticas de precio por celda.
+
+    La columna `price` del resultado es la mediana, para que la capa existente de Kepler
+    siga coloreando por ese campo.
+    """
+    size = cell_size(resolution)
+    lng = df[lng_col].to_numpy(dtype=np.float64)
+    lat = df[lat_col].to_numpy(dtype=np.float64)
+    ix = np.floor(lng / size).astype(np.int64)
+    iy = np.floor(lat / size).astype(np.int64)
+
+    prices = pd.Series(df[price_col].to_numpy(), name='price')
+    groups = prices.groupby([ix, iy], sort=False)
+    stats = groups.agg(['count', 'mean', 'median'])
+    quantiles = groups.quantile(list(PERCENTILES)).unstack()
+    quantiles.columns = [f'p{round(q * 100)}' for q in quantiles.columns]
+    stats = stats.join(quantiles)
+
+    cell_x = stats.index.get_level_values(0).to_numpy()
+    cell_y = stats.index.get_level_values(1).to_numpy()
+    minx = cell_x * size
+    miny = cell_y * size
+    grid = pd.DataFrame({
+        'price': stats['median'].round().astype('int64').to_numpy(),
+        'count': stats['count'].astype('int32').to_numpy(),
+        'mean_price': stats['mean'].round(1).to_numpy(),
+        **{column: stats[column].round().to_numpy() for column in quantiles.columns},
+        'Lng': (minx + size / 2).astype('float32'),
+        'Lat': (miny + size / 2).astype('float32'),
+    })
+    return gpd.GeoDataFrame(grid, geometry=shapely.box(minx, miny, minx + size, miny + size), crs='EPSG:4326')
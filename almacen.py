@@ -0,0 +1,126 @@
+import glob
+import json
+import os
+import re
+
+import geopandas as gpd
+import pandas as pd
+import pyarrow as pa
+import shapely
+
+from artefactos import cache_path, tmp_path_for
+
+
+# Directorio de los ficheros Arrow compartidos; apuntarlo a /dev/shm los deja en memoria compartida
+ALMACEN_DIR = os.environ.get('DASHBOARD_ALMACEN_DIR')
+
+_GEO_KEY = b'dashboard:geo'
+
+
+def _safe_name(name):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', name)
+
+
+def _mapping_rss(path):
+    # Bytes residentes de la proyección del fichero en este proceso (Linux, /proc/self/smaps)
+    try:
+        with open('/proc/self/smaps', encoding='utf-8', errors='replace') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    real_path = os.path.realpath(path)
+    total = 0
+    in_mapping = False
+    for line in lines:
+        parts = line.split()
+        if parts and '-' in parts[0] and len(parts) >= 5:
+            in_mapping = len(parts) >= 6 and parts[5] == real_path
+        elif in_mapping and parts and parts[0] == 'Rss:':
+            total += int(parts[1]) * 1024
+    return total
+
+
+class DatasetStore:
+    """Tablas publicadas una vez como ficheros Arrow IPC y proyectadas en memoria por cada worker.
+
+    Las columnas numéricas se devuelven como vistas de solo lectura sobre el mmap, así que
+    todos los procesos comparten las mismas páginas en lugar de tener cada uno su copia.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or ALMACEN_DIR or os.path.dirname(cache_path('almacen', 'x'))
+        os.makedirs(self.root, exist_ok=True)
+        self._attached = {}
+
+    def _path(self, name, version):
+        return os.path.join(self.root, f'{_safe_name(name)}-{_safe_name(str(version))}.arrow')
+
+    def publish(self, name, version, data):
+        path = self._path(name, version)
+        if os.path.exists(path):
+            return path
+        metadata = {}
+        if isinstance(data, gpd.GeoDataFrame):
+            geometry = data.geometry.name
+            metadata[_GEO_KEY] = json.dumps({'geometry': geometry, 'crs': data.crs.to_string() if data.crs else None})
+            data = pd.DataFrame(data.drop(columns=geometry)).assign(
+                **{geometry: shapely.to_wkb(data.geometry.values)})
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), **metadata})
+        tmp_path = tmp_path_for(path)
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, path)
+        # Las versiones antiguas de la misma tabla ya no se usan
+        for old in glob.glob(os.path.join(self.root, f'{_safe_name(name)}-*.arrow')):
+            if old != path:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+        return path
+
+    def attach(self, name, version, loader):
+        """Devuelve la tabla `name` en `version`, publicándola con loader() si aún no existe."""
+        path = self._path(name, version)
+        if not os.path.exists(path):
+            data = loader()
+            if data is None:
+                return None
+            self.publish(name, version, data)
+
+        allocated = pa.total_allocated_bytes()
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        # split_blocks evita consolidar columnas: las numéricas sin nulos quedan como vistas del mmap
+        df = table.to_pandas(split_blocks=True)
+        private = pa.total_allocated_bytes() - allocated
+
+        geo = (table.schema.metadata or {}).get(_GEO_KEY)
+        if geo is not None:
+            geo = json.loads(geo)
+            geometry = gpd.GeoSeries.from_wkb(df.pop(geo['geometry']), crs=geo['crs'])
+            df = gpd.GeoDataFrame(df, geometry=geometry)
+            private += int(shapely.get_num_coordinates(geometry.values).sum()) * 16
+        # Las cadenas siempre se materializan como objetos de Python en cada proceso
+        private += sum(int(df[c].memory_usage(deep=True, index=False)) for c in df.columns
+                       if c != 'geometry' and pd.api.types.is_string_dtype(df[c].dtype))
+
+        self._attached[name] = {'version': version, 'path': path, 'rows': len(df), 'private_bytes': private}
+        return df
+
+    def report(self):
+        """Tamaño por dataset: fichero proyectado, parte residente en este proceso y memoria privada."""
+        rows = []
+        for name, info in self._attached.items():
+            rows.append({
+                'dataset': name,
+                'version': info['version'],
+                'rows': info['rows'],
+                'mapped_bytes': os.path.getsize(info['path']) if os.path.exists(info['path']) else 0,
+                'resident_bytes': _mapping_rss(info['path']),
+                'private_bytes': info['private_bytes'],
+            })
+        return pd.DataFrame(rows)
+
+
+store = DatasetStore()
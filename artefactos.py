@@ -0,0 +1,183 @@
+import argparse
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+
+# Directorio donde se guardan los artefactos derivados (Parquet, JSON, HTML...)
+CACHE_DIR = os.environ.get('DASHBOARD_CACHE_DIR', '.cache')
+
+
+def cache_path(*parts):
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def file_hash(file_path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_stamp(file_path):
+    stat = os.stat(file_path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def source_version(*file_paths):
+    # Clave barata (mtime + tamaño) para invalidar st.cache_data cuando cambian los ficheros
+    parts = []
+    for file_path in file_paths:
+        try:
+            stamp = file_stamp(file_path)
+        except FileNotFoundError:
+            parts.append(f'{file_path}:missing')
+            continue
+        parts.append(f"{file_path}:{stamp['mtime_ns']}:{stamp['size']}")
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def read_meta(meta_path):
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_meta(meta_path, meta):
+    tmp_path = tmp_path_for(meta_path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, meta_path)
+
+
+def tmp_path_for(file_path):
+    # Se escribe a un temporal y se hace os.replace para que otro worker nunca lea un fichero a medias;
+    # el temporal es propio de cada hilo porque los cargadores de carga.py escriben en paralelo
+    return f'{file_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+
+def build_lock(file_path):
+    """Lock del proceso para reconstruir el artefacto de `file_path` una sola vez entre hilos."""
+    key = os.path.abspath(file_path)
+    with _build_locks_guard:
+        return _build_locks.setdefault(key, threading.Lock())
+
+
+@contextlib.contextmanager
+def file_lock(file_path):
+    """Lock exclusivo entre hilos y procesos (workers, CLI) sobre `<file_path>.lock`; no es reentrante."""
+    with build_lock(file_path), open(f'{file_path}.lock', 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def is_fresh(source_path, meta_path):
+    """Comprueba si el artefacto descrito en meta_path sigue correspondiendo a source_path.
+
+    Primero compara mtime y tamaño; si no coinciden, recurre al hash del contenido
+    para no reconstruir cuando el fichero solo se ha tocado.
+    """
+    meta = read_meta(meta_path)
+    if meta is None:
+        return False, None
+    stamp = file_stamp(source_path)
+    if meta.get('mtime_ns') == stamp['mtime_ns'] and meta.get('size') == stamp['size']:
+        return True, meta
+    if meta.get('size') == stamp['size'] and meta.get('sha256') == file_hash(source_path):
+        meta.update(stamp)
+        write_meta(meta_path, meta)
+        return True, meta
+    return False, meta
+
+
+def source_meta(source_path, **extra):
+    meta = {'source': source_path, 'sha256': file_hash(source_path)}
+    meta.update(file_stamp(source_path))
+    meta.update(extra)
+    return meta
+
+
+# --- Cachés en disco con expulsión LRU (figuras, HTML del mapa) ---
+# Cada acierto hace os.utime sobre la entrada, así que la mtime es la fecha de último acceso
+
+def lru_entries(directory, pattern):
+    """(mtime, tamaño, ruta) de las entradas de `directory`, de la más reciente a la más antigua."""
+    entries = []
+    for path in glob.glob(os.path.join(directory, pattern)):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            # Otro worker la acaba de expulsar
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    return sorted(entries, reverse=True)
+
+
+def evict_lru(directory, pattern, max_entries, max_bytes):
+    kept, total = 0, 0
+    for _, size, path in lru_entries(directory, pattern):
+        kept += 1
+        total += size
+        if kept > max_entries or total > max_bytes:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def remove_entries(directory, pattern):
+    removed = 0
+    for path in glob.glob(os.path.join(directory, pattern)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        removed += 1
+    return removed
+
+
+def lru_cli(description, directory, pattern, clear, name_help=None):
+    """Subcomandos list/clear de una caché LRU; con name_help, clear acepta --name."""
+    parser = argparse.ArgumentParser(description=description)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help='Lista las entradas por fecha de último acceso')
+    clear_parser = subparsers.add_parser('clear', help='Borra entradas de la caché')
+    if name_help:
+        clear_parser.add_argument('--name', help=name_help)
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for _, size, path in lru_entries(directory, pattern):
+            print(f'{os.path.basename(path)}\t{size / 1024:.1f} KB')
+    else:
+        print(f"{clear(args.name) if name_help else clear()} entradas eliminadas")
@@ -0,0 +1,269 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import artefactos
+from figuras import create_composicion_charts, create_migracion_charts, create_pib_chart
+from densidad import ANCHOS_BANDA, price_surface, surface_bands, surface_resolution
+from geometrias import build_geometries, read_geometries, read_source
+from listados import read_listados
+from mapa import build_kepler_map, config_mapa
+from piramide import read_level
+from wdi import WDI_FILES, build_wdi, read_wdi
+
+
+# Caja aproximada de Pekín para los anuncios sintéticos
+BEIJING_CENTER = (116.40, 39.92)
+
+SYNTHETIC_CHUNK = 500_000
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux devuelve KB y macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def measure(stage, fn, repeat=1):
+    """Ejecuta fn `repeat` veces y devuelve tiempos, memoria y las métricas que devuelva fn."""
+    rss_before = _rss_bytes()
+    times = []
+    extra = {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        extra = fn() or {}
+        times.append(time.perf_counter() - start)
+    result = {
+        'stage': stage,
+        'wall_s_min': round(min(times), 6),
+        'wall_s_median': round(statistics.median(times), 6),
+        'repeat': repeat,
+        'rss_before_bytes': rss_before,
+        'rss_after_bytes': _rss_bytes(),
+        'peak_rss_bytes': _peak_rss_bytes(),
+    }
+    result.update(extra)
+    print(f"{stage:<40} {result['wall_s_min']:>10.4f} s", file=sys.stderr)
+    return result
+
+
+def write_synthetic_listings(path, rows, seed=0):
+    """Escribe un CSV con el esquema de precios_clean y `rows` anuncios sintéticos, por bloques."""
+    rng = np.random.default_rng(seed)
+    written = 0
+    header = True
+    while written < rows:
+        n = min(SYNTHETIC_CHUNK, rows - written)
+        ids = np.arange(written, written + n, dtype=np.int64) + 101_000_000_000
+        id_text = pd.Series(ids).astype(str)
+        trade_days = rng.integers(0, 9 * 365, n)
+        chunk = pd.DataFrame({
+            'url': 'https://bj.lianjia.com/chengjiao/' + id_text + '.html',
+            'id': id_text,
+            'Lng': rng.normal(BEIJING_CENTER[0], 0.12, n).round(6),
+            'Lat': rng.normal(BEIJING_CENTER[1], 0.09, n).round(6),
+            'Cid': rng.integers(1_111_027_370_000, 1_111_027_374_000, n),
+            'tradeTime': (pd.Timestamp('2010-01-01') + pd.to_timedelta(trade_days, unit='D')).strftime('%Y-%m-%d'),
+            'totalPrice': 0.0,
+            'price': rng.lognormal(np.log(45000), 0.45, n).astype(np.int64),
+            'square': rng.gamma(6.0, 14.0, n).round(2),
+            'constructionTime': rng.integers(1950, 2017, n),
+            'district': rng.integers(1, 14, n),
+        })
+        chunk['totalPrice'] = (chunk['price'] * chunk['square'] / 10000).round(1)
+        chunk.to_csv(path, mode='w' if header else 'a', header=header, index=False)
+        header = False
+        written += n
+    return path
+
+
+def listings_stages(path, label, repeat):
+    results = []
+    size = os.path.getsize(path)
+
+    def read_csv_raw():
+        df = pd.read_csv(path, low_memory=False)
+        return {'rows': len(df), 'input_bytes': size, 'memory_bytes': int(df.memory_usage(deep=True).sum())}
+
+    def listados_cold():
+        # Solo los artefactos de este fichero: Parquet, almacén particionado (directorio), deltas y metas
+        artefactos_dir = os.path.dirname(artefactos.cache_path('listados', 'x'))
+        prefix = f'{os.path.splitext(os.path.basename(path))[0]}.'
+        for name in os.listdir(artefactos_dir):
+            entry = os.path.join(artefactos_dir, name)
+            if not name.startswith(prefix):
+                continue
+            if os.path.isdir(entry):
+                shutil.rmtree(entry)
+            else:
+                os.remove(entry)
+        df = read_listados(path)
+        return {'rows': len(df), 'memory_bytes': int(df.memory_usage(deep=True).sum())}
+
+    def listados_warm():
+        df = read_listados(path)
+        return {'rows': len(df), 'memory_bytes': int(df.memory_usage(deep=True).sum())}
+
+    results.append(measure(f'load_data:{label}:read_csv', read_csv_raw, repeat))
+    results.append(measure(f'load_data:{label}:parquet_cold', listados_cold, 1))
+    results.append(measure(f'load_data:{label}:parquet_warm', listados_warm, repeat))
+
+    # La superficie de densidad debería depender del tamaño de la rejilla, no del número de anuncios
+    df = read_listados(path)
+    resolution = surface_resolution(10)
+    for bandwidth in ANCHOS_BANDA:
+        def density(bandwidth=bandwidth):
+            surface = price_surface(df, resolution, bandwidth)
+            return {'rows': len(df), 'cells': int(surface.price.size), 'bands': len(surface_bands(surface))}
+
+        results.append(measure(f'densidad:{label}:{bandwidth}m', density, repeat))
+    return results
+
+
+def kepler_stages(layers, repeat):
+    results = []
+    for name, data in layers.items():
+        def add_data(name=name, data=data):
+            build_kepler_map({name: data})
+            return {'rows': len(data)}
+
+        results.append(measure(f'kepler:add_data:{name}', add_data, repeat))
+
+    for transport, use_arrow in (('texto', False), ('arrow', True)):
+        def html(use_arrow=use_arrow):
+            kepler_map = build_kepler_map(layers, use_arrow=use_arrow)
+            page = kepler_map._repr_html_()
+            return {'html_bytes': len(page)}
+
+        results.append(measure(f'kepler:html:{transport}', html, repeat))
+    return results
+
+
+def run(listings_path, synthetic_rows, repeat):
+    results = []
+
+    for file_path in ('beijing_metro.geojson', 'beijing_services.geojson'):
+        results.append(measure(f'load_data:{file_path}', lambda f=file_path: {'rows': len(gpd.read_file(f))}, repeat))
+        results.append(measure(f'geometrias:{file_path}:arrow', lambda f=file_path: {'rows': len(read_source(f))}, repeat))
+        results.append(measure(f'geometrias:{file_path}:build', lambda f=file_path: {'rows': build_geometries(f)['rows']}, 1))
+        results.append(measure(f'geometrias:{file_path}:parquet',
+                               lambda f=file_path: {'rows': len(read_geometries(f, projected=True))}, repeat))
+    results.append(measure('load_data:composicion.csv', lambda: {'rows': len(pd.read_csv('composicion.csv'))}, repeat))
+
+    results.append(measure('wdi:reshape', lambda: {'rows': len(build_wdi(WDI_FILES))}, repeat))
+    results.append(measure('wdi:cached', lambda: {'rows': len(read_wdi(WDI_FILES))}, repeat))
+
+    wdi = read_wdi(WDI_FILES)
+    composicion = pd.read_csv('composicion.csv')
+    results.append(measure('figuras:migracion', lambda: {'figures': len(create_migracion_charts(wdi))}, repeat))
+    results.append(measure('figuras:pib', lambda: {'figures': int(create_pib_chart(wdi) is not None)}, repeat))
+    results.append(measure('figuras:composicion', lambda: {'figures': len(create_composicion_charts(composicion))}, repeat))
+
+    listings = None
+    if listings_path and os.path.exists(listings_path):
+        results += listings_stages(listings_path, os.path.basename(listings_path), repeat)
+        listings = read_listados(listings_path)
+
+    # Las mismas capas que el dashboard (caché GeoParquet y pirámide), no las de gpd.read_file: así
+    # kepler:html:texto cubre lo que de verdad llega al transporte en texto
+    layers = {
+        'ecbukq': read_level('beijing_services.geojson', config_mapa['config']['mapState']['zoom']),
+        '-kgmb4t': read_geometries('beijing_metro.geojson', derived=False),
+    }
+    if listings is not None:
+        layers['-42kwdt'] = listings
+    results += kepler_stages(layers, repeat)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in synthetic_rows:
+            path = os.path.join(tmp, f'synthetic_{rows}.csv')
+            def generate(path=path, rows=rows):
+                write_synthetic_listings(path, rows)
+                return {'rows': rows, 'input_bytes': os.path.getsize(path)}
+
+            results.append(measure(f'synthetic:generate:{rows}', generate, 1))
+            results += listings_stages(path, f'synthetic_{rows}', repeat)
+            os.remove(path)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, new_path):
+    with open(old_path, encoding='utf-8') as f:
+        old = {r['stage']: r for r in json.load(f)['stages']}
+    with open(new_path, encoding='utf-8') as f:
+        new = {r['stage']: r for r in json.load(f)['stages']}
+    for stage, result in new.items():
+        if stage in old and old[stage]['wall_s_min'] > 0:
+            ratio = result['wall_s_min'] / old[stage]['wall_s_min']
+            print(f"{stage:<40} {old[stage]['wall_s_min']:>10.4f} -> {result['wall_s_min']:>10.4f} s  x{ratio:.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks de arranque, recarga y tamaño del mapa del dashboard.')
+    parser.add_argument('--listings', default='precios_clean.csv', help='CSV de anuncios a medir')
+    parser.add_argument('--synthetic', type=int, nargs='*', default=[],
+                        help='Tamaños de anuncios sintéticos a generar y medir (p. ej. 1000000 5000000)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='Fichero JSON de resultados (por defecto bench-<commit>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('ANTES', 'DESPUES'), help='Compara dos ficheros de resultados')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Caché aislada para que las mediciones en frío no dependan de ejecuciones anteriores
+        artefactos.CACHE_DIR = cache_dir
+        stages = run(args.listings, args.synthetic, args.repeat)
+
+    commit = _git_commit()
+    report = {
+        'meta': {
+            'commit': commit,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'pandas': pd.__version__,
+            'geopandas': gpd.__version__,
+        },
+        'stages': stages,
+    }
+    output = args.output or f'bench-{commit or "local"}.json'
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f'Resultados en {output}', file=sys.stderr)
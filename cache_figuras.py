@@ -0,0 +1,83 @@
+import hashlib
+import inspect
+import json
+import os
+
+import plotly.io as pio
+
+from artefactos import cache_path, evict_lru, file_hash, lru_cli, remove_entries, tmp_path_for
+
+
+# Límites de la caché de figuras en disco (LRU por fecha de último acceso)
+MAX_ENTRIES = int(os.environ.get('DASHBOARD_FIGURAS_MAX_ENTRIES', 64))
+MAX_BYTES = int(os.environ.get('DASHBOARD_FIGURAS_MAX_BYTES', 50 * 1024 * 1024))
+
+CACHE_VERSION = 1
+
+# Módulos que dan forma a los datos de las figuras (lectura de WDI, series derivadas, cubo de precios):
+# cambiar su código también cambia las specs, aunque el constructor de figuras.py no cambie
+MODULOS_DATOS = ('wdi.py', 'comparacion.py', 'cubo.py')
+
+
+def _cache_dir():
+    return os.path.dirname(cache_path('figuras', 'x'))
+
+
+def code_version(builder):
+    # Cambiar el módulo que construye la figura, o los que preparan sus datos, invalida sus entradas
+    here = os.path.dirname(os.path.abspath(__file__))
+    paths = [inspect.getsourcefile(inspect.unwrap(builder))]
+    paths += [os.path.join(here, module) for module in MODULOS_DATOS]
+    digest = hashlib.sha256()
+    for path in dict.fromkeys(os.path.abspath(p) for p in paths):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def figure_key(name, sources, builder):
+    parts = [str(CACHE_VERSION), name, code_version(builder)]
+    parts += [f'{source}:{file_hash(source)}' for source in sources]
+    return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()[:20]
+
+
+def evict(max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+    evict_lru(_cache_dir(), '*.json', max_entries, max_bytes)
+
+
+def get_figures(name, sources, build, builder=None):
+    """Specs JSON (dicts) de las figuras de `name`, leídas de disco o construidas con build().
+
+    La clave combina el hash del contenido de `sources` y el del código de `builder`,
+    así que no hace falta invalidar a mano al cambiar los datos o los gráficos.
+    """
+    key = figure_key(name, sources, builder or build)
+    path = cache_path('figuras', f'{name}-{key}.json')
+    try:
+        with open(path, encoding='utf-8') as f:
+            specs = json.load(f)
+        # Se marca el acceso para la expulsión LRU
+        os.utime(path)
+        return specs
+    except (FileNotFoundError, ValueError):
+        pass
+
+    figures = build()
+    if not isinstance(figures, (list, tuple)):
+        figures = [figures]
+    payload = '[' + ','.join(pio.to_json(fig, validate=False) for fig in figures) + ']'
+    tmp_path = tmp_path_for(path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+    evict()
+    return json.loads(payload)
+
+
+def clear(name=None):
+    return remove_entries(_cache_dir(), f'{name}-*.json' if name else '*.json')
+
+
+if __name__ == '__main__':
+    lru_cli('Gestiona la caché de figuras Plotly serializadas.', _cache_dir(), '*.json', clear,
+            name_help='Solo las figuras con este nombre (p. ej. migracion)')
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from artefactos import cache_path, evict_lru, lru_cli, remove_entries, tmp_path_for
+
+
+# Límites de la caché de HTML del mapa: en memoria por proceso y en disco compartida por los workers
+MAX_MEMORIA_BYTES = int(os.environ.get('DASHBOARD_MAPA_MAX_MEMORIA', 64 * 1024 * 1024))
+MAX_ENTRIES = int(os.environ.get('DASHBOARD_MAPA_MAX_ENTRIES', 32))
+MAX_BYTES = int(os.environ.get('DASHBOARD_MAPA_MAX_BYTES', 256 * 1024 * 1024))
+
+# Renderizar la vista por defecto al arrancar
+PRECALENTAR = os.environ.get('DASHBOARD_MAPA_PRECALENTAR', '0') == '1'
+
+CACHE_VERSION = 1
+
+_memoria = OrderedDict()
+_memoria_bytes = 0
+_lock = threading.Lock()
+
+
+def _cache_dir():
+    return os.path.dirname(cache_path('mapas', 'x'))
+
+
+def render_key(versions, config, selection):
+    """Clave del HTML: versiones de los datasets, contenido de la config y selección de capas/filtros."""
+    payload = json.dumps({'cache': CACHE_VERSION, 'versions': versions, 'config': config, 'selection': selection},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:20]
+
+
+def _remember(key, html):
+    global _memoria_bytes
+    with _lock:
+        if key in _memoria:
+            _memoria.move_to_end(key)
+            return
+        _memoria[key] = html
+        _memoria_bytes += len(html)
+        # Siempre se conserva al menos la última entrada, aunque supere el límite
+        while _memoria_bytes > MAX_MEMORIA_BYTES and len(_memoria) > 1:
+            _, old = _memoria.popitem(last=False)
+            _memoria_bytes -= len(old)
+
+
+def evict(max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+    evict_lru(_cache_dir(), '*.html', max_entries, max_bytes)
+
+
+def lookup(key):
+    """HTML cacheado para `key` (memoria y después disco), o None."""
+    with _lock:
+        if key in _memoria:
+            _memoria.move_to_end(key)
+            return _memoria[key]
+    path = cache_path('mapas', f'{key}.html')
+    try:
+        with open(path, 'rb') as f:
+            html = f.read()
+    except FileNotFoundError:
+        return None
+    # Se marca el acceso para la expulsión LRU
+    os.utime(path)
+    _remember(key, html)
+    return html
+
+
+def store(key, html):
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+    path = cache_path('mapas', f'{key}.html')
+    tmp_path = tmp_path_for(path)
+    with open(tmp_path, 'wb') as f:
+        f.write(html)
+    os.replace(tmp_path, path)
+    _remember(key, html)
+    evict()
+    return html
+
+
+def get_html(key, render):
+    """HTML del mapa para `key`; en un fallo se genera con render() y se guarda en ambas capas."""
+    html = lookup(key)
+    if html is None:
+        html = store(key, render())
+    return html
+
+
+def clear():
+    global _memoria_bytes
+    with _lock:
+        _memoria.clear()
+        _memoria_bytes = 0
+    return remove_entries(_cache_dir(), '*.html')
+
+
+if __name__ == '__main__':
+    lru_cli('Gestiona la caché de HTML del mapa de Kepler.gl.', _cache_dir(), '*.html', clear)
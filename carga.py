@@ -0,0 +1,114 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+import geopandas as gpd
+import pandas as pd
+
+from rendimiento import ENABLED, record_latency
+
+
+# Hilos para la carga inicial: la lectura de CSV/Parquet (pyarrow) y de GeoJSON (GDAL) libera el GIL
+MAX_WORKERS = int(os.environ.get('DASHBOARD_CARGA_WORKERS', 8))
+
+logger = logging.getLogger('dashboard.carga')
+
+
+class Datasets(NamedTuple):
+    """Datasets del dashboard; un campo vale None si su fichero no se pudo cargar."""
+    wdi: Optional[pd.DataFrame] = None
+    composicion: Optional[pd.DataFrame] = None
+    metro: Optional[gpd.GeoDataFrame] = None
+    services: Optional[gpd.GeoDataFrame] = None
+    listados: Optional[pd.DataFrame] = None
+
+
+class Carga(NamedTuple):
+    datasets: Datasets
+    # {campo: segundos} de cada carga y tiempo total de pared
+    timings: dict
+    wall: float
+    # {campo: (fichero, excepción)}
+    errors: dict
+
+
+def _timed_load(name, loader):
+    start = time.perf_counter()
+    try:
+        data, error = loader(), None
+    except Exception as e:
+        data, error = None, e
+    elapsed = time.perf_counter() - start
+    if ENABLED:
+        record_latency(f'carga:{name}', elapsed)
+    return data, error, elapsed
+
+
+def load_parallel(tasks, max_workers=MAX_WORKERS):
+    """Ejecuta en paralelo las cargas independientes de `tasks` y devuelve un Carga.
+
+    tasks: {campo de Datasets: (fichero, loader)}. Los fallos no interrumpen el resto de
+    cargas: el campo queda a None y la excepción se devuelve en `errors` para que quien
+    llame la muestre (los hilos no tienen contexto de Streamlit).
+    """
+    unknown = set(tasks) - set(Datasets._fields)
+    if unknown:
+        raise ValueError(f'Campos desconocidos: {sorted(unknown)}')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tasks)))) as executor:
+        futures = {name: executor.submit(_timed_load, name, loader) for name, (_, loader) in tasks.items()}
+        results = {name: future.result() for name, future in futures.items()}
+    wall = time.perf_counter() - start
+
+    timings = {name: elapsed for name, (_, _, elapsed) in results.items()}
+    errors = {name: (tasks[name][0], error) for name, (_, error, _) in results.items() if error is not None}
+    for name, (file_path, error) in errors.items():
+        logger.warning('No se pudo cargar %s (%s): %s', name, file_path, error)
+    logger.info('Carga inicial en %.2f s (suma secuencial %.2f s)', wall, sum(timings.values()))
+    datasets = Datasets(**{name: data for name, (data, _, _) in results.items()})
+    return Carga(datasets, timings, wall, errors)
+
+
+class DatasetLoader:
+    """Datasets cargados por (campo, versión), compartidos entre sesiones.
+
+    En cada llamada solo se cargan los campos que faltan, cuya versión ha cambiado o que
+    fallaron la vez anterior: un fallo no se guarda, así que el siguiente rerun reintenta
+    esa carga sin volver a cargar las que ya salieron bien.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+        # {campo: (versión, datos)} de las cargas correctas
+        self._loaded = {}
+        # Última medición de cada campo y tiempo de pared de la última tanda
+        self._timings = {}
+        self._wall = 0.0
+        self._lock = threading.Lock()
+
+    def load(self, tasks, versions):
+        """Carga lo pendiente de `tasks` ({campo: (fichero, loader)}) con load_parallel.
+
+        versions: {campo: versión}. Devuelve un Carga con todos los datasets disponibles y
+        solo los errores de esta llamada.
+        """
+        with self._lock:
+            pending = {name: task for name, task in tasks.items()
+                       if self._loaded.get(name, (None,))[0] != versions[name]}
+            errors = {}
+            if pending:
+                carga = load_parallel(pending, self.max_workers)
+                for name in pending:
+                    if name in carga.errors:
+                        self._loaded.pop(name, None)
+                    else:
+                        self._loaded[name] = (versions[name], getattr(carga.datasets, name))
+                self._timings.update(carga.timings)
+                self._wall = carga.wall
+                errors = carga.errors
+            datasets = Datasets(**{name: self._loaded[name][1] for name in tasks if name in self._loaded})
+            return Carga(datasets, dict(self._timings), self._wall, errors)
@@ -0,0 +1,150 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+
+# Indicadores de los ficheros WDI que se pueden comparar entre países
+INDICADORES = {
+    'SM.POP.NETM': 'Migración neta',
+    'SP.URB.TOTL.IN.ZS': 'Población urbana (%)',
+    'NY.GDP.MKTP.KD.ZG': 'Crecimiento del PIB (%)',
+}
+
+# Códigos de agregados regionales y por ingreso del Banco Mundial: no son países y se
+# excluyen de rangos, z-scores y percentiles
+AGREGADOS = frozenset({
+    'AFE', 'AFW', 'ARB', 'CEB', 'CSS', 'EAP', 'EAR', 'EAS', 'ECA', 'ECS', 'EMU', 'EUU', 'FCS', 'HIC',
+    'HPC', 'IBD', 'IBT', 'IDA', 'IDB', 'IDX', 'INX', 'LAC', 'LCN', 'LDC', 'LIC', 'LMC', 'LMY', 'LTE',
+    'MEA', 'MIC', 'MNA', 'NAC', 'OED', 'OSS', 'PRE', 'PSS', 'PST', 'SAS', 'SSA', 'SSF', 'SST', 'TEA',
+    'TEC', 'TLA', 'TMN', 'TSA', 'TSS', 'UMC', 'WLD',
+})
+
+GRUPOS = {
+    'BRICS': ('BRA', 'RUS', 'IND', 'CHN', 'ZAF'),
+    'G7': ('CAN', 'FRA', 'DEU', 'ITA', 'JPN', 'GBR', 'USA'),
+    'Asia oriental': ('CHN', 'JPN', 'KOR', 'MNG', 'HKG', 'MAC'),
+}
+
+VENTANA = 5
+
+
+class WDIMatrices:
+    """Todos los indicadores WDI como matrices densas país × año (NaN donde no hay dato).
+
+    Las filas son países en el mismo orden para todos los indicadores, así que elegir
+    países para un gráfico es indexar filas: rows(['CHN', 'IND']).
+    """
+
+    def __init__(self, wdi):
+        country_codes = wdi['country_code'].astype(str).to_numpy()
+        self.countries = np.unique(country_codes)
+        names = pd.Series(wdi['country'].astype(str).to_numpy(), index=country_codes)
+        self.names = names[~names.index.duplicated()].reindex(self.countries).to_numpy()
+        self.years = np.arange(int(wdi['year'].min()), int(wdi['year'].max()) + 1)
+        self._row = {code: i for i, code in enumerate(self.countries)}
+        self.is_country = np.array([code not in AGREGADOS for code in self.countries])
+
+        rows = np.searchsorted(self.countries, country_codes)
+        cols = wdi['year'].to_numpy().astype(np.int64) - self.years[0]
+        codes = wdi['indicator_code'].astype(str).to_numpy()
+        values = wdi['value'].to_numpy(dtype=np.float64)
+        self.values = {}
+        for code in np.unique(codes):
+            matrix = np.full((len(self.countries), len(self.years)), np.nan)
+            mask = codes == code
+            matrix[rows[mask], cols[mask]] = values[mask]
+            self.values[code] = matrix
+
+    def rows(self, codes):
+        return np.array([self._row[code] for code in codes if code in self._row], dtype=np.int64)
+
+    def to_frame(self, matrix, codes):
+        """Tabla larga (country, year, value) de las filas `codes` de `matrix`, para graficar."""
+        rows = self.rows(codes)
+        frame = pd.DataFrame(matrix[rows], columns=self.years).assign(country=self.names[rows])
+        frame = frame.melt(id_vars='country', var_name='year', value_name='value')
+        return frame.dropna(subset=['value']).reset_index(drop=True)
+
+
+def rolling_mean(matrix, window=VENTANA):
+    # Media de los valores presentes en la ventana que termina en cada año (sumas acumuladas)
+    present = ~np.isnan(matrix)
+    sums = np.cumsum(np.where(present, matrix, 0.0), axis=1)
+    counts = np.cumsum(present, axis=1)
+    sums[:, window:] = sums[:, window:] - sums[:, :-window]
+    counts[:, window:] = counts[:, window:] - counts[:, :-window]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def cagr(matrix, window=VENTANA):
+    """Tasa de crecimiento anual compuesta (%) respecto al valor de `window` años antes."""
+    result = np.full(matrix.shape, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio = matrix[:, window:] / matrix[:, :-window]
+        result[:, window:] = np.where(ratio > 0, (ratio ** (1 / window) - 1) * 100, np.nan)
+    return result
+
+
+def zscores(matrix, mask=None):
+    # Por año, respecto a la media y desviación de los países de `mask` (por defecto, todos)
+    reference = matrix if mask is None else matrix[mask]
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        # Años sin ningún dato: nanmean/nanstd avisan y devuelven NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean = np.nanmean(reference, axis=0)
+        std = np.nanstd(reference, axis=0)
+        return np.where(std > 0, (matrix - mean) / std, np.nan)
+
+
+def ranks(matrix, mask=None):
+    """Puesto de cada país por año (1 = valor más alto) entre los países de `mask`."""
+    reference = np.where(mask[:, None], matrix, np.nan) if mask is not None else matrix
+    # Los NaN van al final del orden descendente y no reciben puesto
+    order = np.argsort(np.where(np.isnan(reference), np.inf, -reference), axis=0, kind='stable')
+    result = np.empty(matrix.shape)
+    np.put_along_axis(result, order, np.arange(1, matrix.shape[0] + 1, dtype=np.float64)[:, None], axis=0)
+    result[np.isnan(reference)] = np.nan
+    return result
+
+
+def peer_percentiles(matrix, peers):
+    """Percentil (0-100) de cada país por año dentro del grupo `peers` (índices de fila)."""
+    peer_values = matrix[peers]
+    valid = ~np.isnan(peer_values)
+    # (países, 1, años) frente a (1, pares, años): fracción de pares con valor menor o igual
+    below = (peer_values[None, :, :] <= matrix[:, None, :]) & valid[None, :, :]
+    n = valid.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = np.where(n > 0, below.sum(axis=1) / n * 100, np.nan)
+    result[np.isnan(matrix)] = np.nan
+    return result
+
+
+METRICAS = {
+    'valor': 'Valor',
+    'media_movil': f'Media móvil ({VENTANA} años)',
+    'cagr': f'CAGR a {VENTANA} años (%)',
+    'zscore': 'Z-score entre países',
+    'rango': 'Puesto entre países',
+    'percentil': 'Percentil en el grupo',
+}
+
+
+def derived(matrices, indicator, metric, group=None):
+    """Serie derivada `metric` del indicador para todos los países a la vez."""
+    matrix = matrices.values[indicator]
+    if metric == 'valor':
+        return matrix
+    if metric == 'media_movil':
+        return rolling_mean(matrix)
+    if metric == 'cagr':
+        return cagr(matrix)
+    if metric == 'zscore':
+        return zscores(matrix, matrices.is_country)
+    if metric == 'rango':
+        return ranks(matrix, matrices.is_country)
+    if metric == 'percentil':
+        return peer_percentiles(matrix, matrices.rows(GRUPOS[group]))
+    raise ValueError(f'Métrica desconocida: {metric}')
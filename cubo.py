@@ -0,0 +1,124 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+
+# Precisión relativa del sketch de cuantiles: cubos logarítmicos de razón GAMMA
+PRECISION_RELATIVA = 0.01
+GAMMA = (1 + PRECISION_RELATIVA) / (1 - PRECISION_RELATIVA)
+
+CUANTILES = (0.25, 0.5, 0.75, 0.9)
+
+# price ya viene en ¥/m²; total_price en ¥
+METRICAS = ('price', 'total_price')
+
+DIMENSIONES = ('district', 'year', 'month')
+
+COLUMNAS_CUBO = ['district', 'tradeTime', 'price', 'totalPrice', 'square']
+
+
+def bucket_of(values):
+    return np.ceil(np.log(values) / np.log(GAMMA)).astype(np.int32)
+
+
+def bucket_value(buckets):
+    # Punto medio (en escala relativa) del cubo: el error queda acotado por PRECISION_RELATIVA
+    return 2 * GAMMA ** buckets.astype(np.float64) / (GAMMA + 1)
+
+
+def build_cube(df):
+    """Sketch de cuantiles por distrito × año × mes y métrica: recuento de anuncios por cubo logarítmico.
+
+    Los sketches se combinan sumando recuentos, así que agregar meses, distritos o lotes
+    de anuncios es un groupby-sum sin volver a la tabla original.
+    """
+    if not len(df):
+        return empty_cube()
+    trade = pd.to_datetime(df['tradeTime'], errors='coerce')
+    base = pd.DataFrame({
+        'district': df['district'].astype('string').to_numpy(),
+        'year': trade.dt.year.to_numpy(),
+        'month': trade.dt.month.to_numpy(),
+    })
+    price = pd.to_numeric(df['price'], errors='coerce').to_numpy(dtype=np.float64)
+    if 'totalPrice' in df.columns:
+        # totalPrice viene en decenas de miles de yuanes
+        total = pd.to_numeric(df['totalPrice'], errors='coerce').to_numpy(dtype=np.float64) * 10000
+    else:
+        total = price * pd.to_numeric(df['square'], errors='coerce').to_numpy(dtype=np.float64)
+
+    parts = []
+    for metric, values in (('price', price), ('total_price', total)):
+        valid = np.isfinite(values) & (values > 0) & base['year'].notna().to_numpy()
+        part = base[valid].copy()
+        part['metric'] = metric
+        part['bucket'] = bucket_of(values[valid])
+        parts.append(part)
+    long = pd.concat(parts, ignore_index=True)
+    long['year'] = long['year'].astype('int16')
+    long['month'] = long['month'].astype('int8')
+    cube = long.groupby([*DIMENSIONES, 'metric', 'bucket'], observed=True).size().rename('count').reset_index()
+    return _compact(cube)
+
+
+def _compact(cube):
+    cube['count'] = cube['count'].astype('int64')
+    cube['district'] = cube['district'].astype('category')
+    cube['metric'] = cube['metric'].astype('category')
+    return cube
+
+
+def empty_cube():
+    return _compact(pd.DataFrame({
+        'district': pd.Series(dtype='string'),
+        'year': pd.Series(dtype='int16'),
+        'month': pd.Series(dtype='int8'),
+        'metric': pd.Series(dtype='string'),
+        'bucket': pd.Series(dtype='int32'),
+        'count': pd.Series(dtype='int64'),
+    }))
+
+
+def merge_cubes(cubes):
+    """Suma los recuentos de `cubes`; un cubo con recuentos negativos descuenta sus anuncios."""
+    cube = pd.concat(cubes, ignore_index=True)
+    cube['district'] = cube['district'].astype('string')
+    cube['metric'] = cube['metric'].astype('string')
+    cube = cube.groupby([*DIMENSIONES, 'metric', 'bucket'], observed=True)['count'].sum().reset_index()
+    return _compact(cube[cube['count'] > 0].reset_index(drop=True))
+
+
+def rollup(cube, by=('year',), metric='price', districts=None, years=None, quantiles=CUANTILES):
+    """Recuento y cuantiles aproximados de `metric` agrupando el cubo por las dimensiones `by`."""
+    by = list(by)
+    mask = cube['metric'] == metric
+    if districts:
+        mask &= cube['district'].isin(districts)
+    if years is not None:
+        mask &= cube['year'].between(*years)
+    sketch = cube.loc[mask].groupby([*by, 'bucket'], observed=True)['count'].sum().reset_index()
+    if not len(sketch):
+        return pd.DataFrame(columns=[*by, 'count', *[f'p{round(q * 100)}' for q in quantiles]])
+
+    sketch = sketch.sort_values([*by, 'bucket'])
+    groups = sketch.groupby(by, observed=True, sort=False)
+    sketch['cumulative'] = groups['count'].cumsum()
+    sketch['total'] = groups['count'].transform('sum')
+
+    result = groups['count'].sum().rename('count').to_frame()
+    for q in quantiles:
+        reached = sketch[sketch['cumulative'] >= q * sketch['total']]
+        first = reached.groupby(by, observed=True, sort=False)['bucket'].first()
+        result[f'p{round(q * 100)}'] = bucket_value(first.reindex(result.index).to_numpy()).round(0)
+    return result.reset_index()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Construye el cubo de estadísticas de precio por distrito y mes.')
+    parser.add_argument('--listados', default='precios_clean.csv')
+    args = parser.parse_args()
+    # incremental.py importa este módulo: el cubo persistido se lee desde allí
+    from incremental import read_cube
+    cube = read_cube(args.listados)
+    print(rollup(cube, by=('year',)).to_string(index=False))
@@ -1,565 +1,472 @@
+import logging
+import threading
+
+import numpy as np
 import pandas as pd
-import geopandas as gpd
-import plotly.express as px
 
 import streamlit as st
 
 import streamlit.components.v1 as components
+from streamlit.runtime.scriptrunner import add_script_run_ctx
+
+from almacen import store
+from agregacion import price_grid, resolution_for_zoom
+from accesibilidad import read_accesibilidad
+from artefactos import source_version
+from cache_figuras import get_figures
+from cache_mapa import PRECALENTAR, get_html, render_key
+from carga import DatasetLoader
+from espacial import SpatialIndex, viewport_bounds
+from filtros import ListingIndex
+from geometrias import geometry_version, read_geometries
+from comparacion import GRUPOS, INDICADORES, METRICAS, WDIMatrices, derived
+from densidad import ANCHOS_BANDA, price_surface, surface_bands, surface_resolution
+from figuras import (create_comparacion_chart, create_composicion_charts, create_migracion_charts, create_pib_chart,
+                     create_precios_charts)
+from incremental import dataset_stamp, district_versions, read_aggregates, read_cube, read_current
+from listados import COLUMNAS_MAPA, is_partitioned, partition_values
+from mapa import MAX_FEATURES_MAPA, TRANSPORTE_BINARIO, build_kepler_map, config_mapa, supports_arrow
+from piramide import level_for_zoom, read_level
+from rendimiento import ENABLED as RENDIMIENTO, cached_stage, export_json, medir, record_bytes, snapshot
+from wdi import WDI_FILES, read_wdi
+
+
+logger = logging.getLogger('dashboard')
+
+# Carga inicial: todos los ficheros a la vez en un pool de hilos (carga.py). El cargador es
+# compartido y guarda cada dataset por su versión: solo se recarga lo que cambia o falló
+@st.cache_resource
+def dataset_loader():
+    return DatasetLoader()
+
+def load_datasets(versions, listados=True):
+    zoom = config_mapa['config']['mapState']['zoom']
+    tasks = {
+        'wdi': (', '.join(WDI_FILES), lambda: read_wdi(WDI_FILES)),
+        'composicion': ('composicion.csv', lambda: pd.read_csv('composicion.csv')),
+        'metro': ('beijing_metro.geojson',
+                  lambda: store.attach('beijing_metro.geojson', versions['metro'],
+                                       lambda: read_geometries('beijing_metro.geojson', derived=False))),
+        'services': ('beijing_services.geojson',
+                     lambda: store.attach('beijing_services.geojson', versions['services'],
+                                          lambda: read_level('beijing_services.geojson', zoom))),
+    }
+    # Con el almacén particionado no se carga la tabla entera: el mapa lee solo las particiones elegidas.
+    # La caché Parquet y los agregados de los anuncios se preparan dentro de esta tarea, no antes
+    if listados and not listados_particionados():
+        tasks['listados'] = ('precios_clean.csv',
+                             lambda: store.attach('precios_clean.csv', versions['listados'],
+                                                  lambda: read_listados_mapa('precios_clean.csv')))
+    return dataset_loader().load(tasks, versions)
+
+def listados_particionados():
+    try:
+        return is_partitioned('precios_clean.csv')
+    except FileNotFoundError:
+        return False
+
+# 'precios' es la versión del dataset de anuncios (cubo y agregados); 'listados', la de la tabla
+# del mapa, que además lleva la distancia al metro y depende de las capas de metro y servicios.
+# Todas salen de mtime y tamaño de ficheros: en cada rerun no se prepara ni se lee ningún dataset
+def dataset_versions():
+    zoom = config_mapa['config']['mapState']['zoom']
+    precios = dataset_stamp('precios_clean.csv')
+    return {
+        'wdi': source_version(*WDI_FILES),
+        'composicion': source_version('composicion.csv'),
+        'metro': geometry_version('beijing_metro.geojson'),
+        'services': f"{geometry_version('beijing_services.geojson')}:z{level_for_zoom(zoom)}",
+        'precios': precios,
+        'listados': f"{precios}:{source_version('beijing_metro.geojson', 'beijing_services.geojson')}",
+    }
 
-from keplergl import KeplerGl
-
-from streamlit_keplergl import keplergl_static
-
-
-
-# Carga de datos (mismo código que antes)
-
-migracion = pd.read_csv('Migración.csv', sep=',', skiprows=3)
-
-migracion = migracion[migracion['Country Name'] == 'China']
-
-migracion = migracion.drop(columns=['Country Name', 'Indicator Name', 'Indicator Code'])
-
-migracion = migracion.T
-
-migracion.columns = migracion.iloc[0]
-
-migracion = migracion[1:]
-
-migracion = migracion.dropna()
-
-migracion = migracion.rename(columns={'CHN': 'Net Migration'})
-
-migracion = migracion.rename_axis('Year').reset_index()
-
-migracion = migracion.reset_index(drop=True)
-
-migracion['Year'] = migracion['Year'].astype(int)
-
-migracion = migracion[migracion['Year'] >= 1990]
-
-
-
-crecimiento = pd.read_csv('Crecimiento_urbano.csv', sep=',')
-
-crecimiento = crecimiento.T
-
-crecimiento = crecimiento.reset_index()
-
-crecimiento.columns = crecimiento.iloc[3]
-
-crecimiento = crecimiento[4:]
-
-crecimiento = crecimiento.rename(columns={'CHN': 'Tasa_crecimiento', 'Country Code': 'Año'})
-
-crecimiento = crecimiento.dropna(axis=1, how='any')
-
-crecimiento['Año'] = crecimiento['Año'].str.extract('(\d+)').astype(int)
-
-
-
-pib = pd.read_csv('Gdp.csv', sep=',', skiprows=3)
-
-pib = pib[pib['Country Name'] == 'China']
-
-pib = pib.drop(columns=['Country Name', 'Indicator Name', 'Indicator Code'])
-
-pib = pib.T
-
-pib = pib.reset_index()
-
-pib.columns = pib.iloc[0]
-
-pib = pib[1:]
-
-pib.columns = ['Año', 'Tasa PIB']
-
-pib = pib.dropna()
-
-pib['Año'] = pib['Año'].astype(int)
-
-pib = pib[pib['Año'] >= 1990]
-
-pib['Tasa PIB'] = pib['Tasa PIB'].astype(float)
-
-pib = pib.reset_index(drop=True)
-
-
-
-# Creación de gráficos (mismo código que antes)
-
-def update_fig_layout(fig, y_title):
-
-  fig.update_traces(mode='lines+markers', marker=dict(size=10, line=dict(width=2, color='DarkSlateGrey')))
-
-  fig.update_layout(xaxis_title='Año', yaxis_title=y_title)
-
-  return fig
-
-
-
-fig_migracion = update_fig_layout(px.line(migracion, x='Year', y='Net Migration', title='Migración neta de China'), 'Migración neta')
+# Mismos mensajes que mostraba la carga secuencial; el cargador reintenta en el siguiente rerun
+# solo los datasets que fallaron
+def show_load_errors(carga):
+    for file_path, error in carga.errors.values():
+        if isinstance(error, FileNotFoundError):
+            st.error(f"No se encontró el archivo: {file_path}")
+        else:
+            st.error(f"Error al cargar el archivo {file_path}: {error}")
+
+
+# --- Gráficos cacheados por versión de los datos de origen ---
+# Las specs JSON se comparten entre sesiones y workers a través de la caché en disco (cache_figuras.py)
+@cached_stage('get_migracion_charts', st.cache_resource)
+def get_migracion_charts(version, _wdi):
+    return get_figures('migracion', WDI_FILES, lambda: create_migracion_charts(_wdi),
+                       builder=create_migracion_charts)
+
+@cached_stage('get_pib_chart', st.cache_resource)
+def get_pib_chart(version, _wdi):
+    return get_figures('pib', WDI_FILES, lambda: create_pib_chart(_wdi),
+                       builder=create_pib_chart)[0]
+
+@cached_stage('get_composicion_charts', st.cache_resource)
+def get_composicion_charts(version, _composicion):
+    return get_figures('composicion', ['composicion.csv'], lambda: create_composicion_charts(_composicion),
+                       builder=create_composicion_charts)
+
+# Matrices país × año de todos los indicadores WDI y sus series derivadas, calculadas para
+# todos los países a la vez; elegir países solo indexa filas (comparacion.py)
+@cached_stage('build_wdi_matrices', st.cache_resource)
+def build_wdi_matrices(version, _wdi):
+    return WDIMatrices(_wdi)
+
+@cached_stage('derived_matrix', st.cache_resource(max_entries=64))
+def derived_matrix(version, indicator, metric, group, _matrices):
+    return derived(_matrices, indicator, metric, group)
+
+# Cubo de estadísticas de precio (cubo.py), mantenido al aplicar deltas; version es la del dataset de anuncios
+@cached_stage('load_cube', st.cache_data)
+def load_cube(version):
+    try:
+        return read_cube('precios_clean.csv')
+    except Exception as e:
+        st.error(f"Error al cargar el archivo precios_clean.csv: {e}")
+        return None
 
-fig_crecimiento = update_fig_layout(px.line(crecimiento, x='Año', y='Tasa_crecimiento', title='Crecimiento urbano de China'), 'Tasa de crecimiento urbano(%)')
+# Recuento, media y desviación del precio por distrito, mantenidos al aplicar deltas (incremental.py)
+@cached_stage('load_district_stats', st.cache_data)
+def load_district_stats(version):
+    try:
+        return read_aggregates('precios_clean.csv', 'district')
+    except Exception as e:
+        st.error(f"Error al cargar el archivo precios_clean.csv: {e}")
+        return None
 
-fig_pib = update_fig_layout(px.line(pib, x='Año', y='Tasa PIB', title='Tasa de crecimiento del PIB de China'), 'Tasa PIB(%)')
+# La clave lleva la versión de cada distrito mostrado: un delta solo invalida los gráficos
+# de las selecciones que incluyen alguno de sus distritos
+@cached_stage('get_precios_charts', st.cache_resource(max_entries=64))
+def get_precios_charts(districts, versions, metric, years, year, _cube):
+    return create_precios_charts(_cube, metric, list(districts) if districts else None, years, year)
+
+def district_options(cube):
+    # Los distritos son códigos numéricos guardados como texto: se ordenan por número ('2' antes que '10')
+    return sorted(cube['district'].astype(str).unique(),
+                  key=lambda d: (not d.lstrip('-').isdigit(), int(d) if d.lstrip('-').isdigit() else 0, d))
+
+# --- Índices espaciales y recorte por viewport ---
+@cached_stage('build_spatial_index', st.cache_resource(max_entries=64))
+def build_spatial_index(name, version, _data):
+    return SpatialIndex(_data)
+
+# Precios agregados por celda; se cachea una cuadrícula por resolución y combinación de filtros
+@cached_stage('load_price_grid', st.cache_data(max_entries=64))
+def load_price_grid(version, resolution, filter_key, _df, _rows=None):
+    return price_grid(_df if _rows is None else _df.iloc[_rows], resolution)
+
+# Superficie de precio suavizada, disuelta en bandas; una por resolución, ancho de banda y filtros
+@cached_stage('load_density', st.cache_data(max_entries=32))
+def load_density(version, resolution, bandwidth, filter_key, _df, _rows=None):
+    return surface_bands(price_surface(_df if _rows is None else _df.iloc[_rows], resolution, bandwidth))
+
+def cull_layer(data, name, version, bounds, within=None):
+    index = build_spatial_index(name, version, data)
+    return index.cull(data, bounds, MAX_FEATURES_MAPA.get(name), within=within)
+
+# --- Filtros de anuncios ---
+COLUMNAS_FILTRO = ['district', 'square', 'constructionTime']
+
+FILTROS_RANGO = {
+    'price': "Precio (¥/m²)",
+    'square': "Superficie (m²)",
+    'constructionTime': "Año de construcción",
+    'dist_metro_m': "Distancia al metro (m)",
+}
 
+FILTROS_CATEGORIA = {
+    'district': "Distrito",
+    'Cid': "Comunidad (Cid)",
+}
 
-@st.cache_data
-def load_data(file_path):
+def read_listados_mapa(file_path, filters=None, districts=None):
+    df = read_current(file_path, columns=list(dict.fromkeys(COLUMNAS_MAPA + COLUMNAS_FILTRO)), filters=filters)
     try:
-        if file_path.endswith('.geojson') or file_path.endswith('.json'):
-            gdf = gpd.read_file(file_path)
-            return gdf
-        elif file_path.endswith('.csv'):
-            df = pd.read_csv(file_path)
-            return df
+        if districts is None:
+            acceso = read_accesibilidad(file_path)
         else:
-            st.error(f"Formato de archivo no soportado: {file_path}")
-            return None
-    except FileNotFoundError:
-        st.error(f"No se encontró el archivo: {file_path}")
-        return None
+            # Una caché por distrito: cada vista solo calcula los distritos que aún no estaban
+            acceso = pd.concat([read_accesibilidad(file_path, district=d) for d in districts], ignore_index=True)
+        acceso = acceso.drop_duplicates(subset=['id']).set_index('id')
+    except FileNotFoundError as e:
+        # Sin las capas de metro/servicios no se ofrece el filtro de distancia; su versión forma
+        # parte de la clave de la tabla, así que se recalcula cuando aparezcan
+        logger.warning('Sin variables de accesibilidad para %s: %s', file_path, e)
+        return df
+    except Exception:
+        # Cualquier otro fallo se propaga: la tabla sin la columna no se publica y el cargador
+        # reintenta en el siguiente rerun
+        logger.exception('Error al calcular la accesibilidad de %s', file_path)
+        raise
+    df['dist_metro_m'] = df['id'].map(acceso['dist_metro_m']).astype('float32')
+    return df
+
+# --- Almacén particionado (listados por encima de STREAMING_THRESHOLD) ---
+# Solo se leen las particiones de distrito y año elegidas en la barra lateral, nunca la tabla entera
+@cached_stage('load_partition_values', st.cache_data)
+def load_partition_values(version):
+    return partition_values('precios_clean.csv')
+
+@cached_stage('load_listados_vista', st.cache_resource(max_entries=8))
+def load_listados_vista(version, districts, years):
+    filters = [('district', 'in', list(districts)), ('year', '>=', years[0]), ('year', '<=', years[1])]
+    vista = f"{version}-d{'_'.join(map(str, districts))}-y{years[0]}_{years[1]}"
+    try:
+        # Una sola vista publicada a la vez: la anterior se borra al publicar la nueva
+        return store.attach('precios_clean.csv-vista', vista,
+                            lambda: read_listados_mapa('precios_clean.csv', filters, districts))
     except Exception as e:
-        st.error(f"Error al cargar el archivo {file_path}: {e}")
+        st.error(f"Error al cargar el archivo precios_clean.csv: {e}")
         return None
-beijing_metro_gdf = load_data('beijing_metro.geojson')
-beijing_services_gdf = load_data('beijing_services.geojson')
-precios_clean_df = load_data('precios_clean.csv')
-composicion = load_data('composicion.csv')
-# --- Configuración del mapa de Kepler.gl ---
-config_mapa = {
-    "version": "v1",
-    "config": {
-        "visState": {
-            "filters": [],
-            "layers": [
-                {
-                    "id": "ju8rai",
-                    "type": "geojson",
-                    "config": {
-                        "dataId": "-42kwdt",
-                        "columnMode": "geojson",
-                        "label": "precios_clean",
-                        "color": [130, 154, 227],
-                        "highlightColor": [252, 242, 26, 255],
-                        "columns": {"geojson": "geometry"},
-                        "isVisible": True,
-                        "visConfig": {
-                            "opacity": 0.8,
-                            "strokeOpacity": 0.8,
-                            "thickness": 3.4,
-                            "strokeColor": None,
-                            "colorRange": {
-                                "colors": ["#F7F4F9", "#DCC9E2", "#D08AC2", "#E33890", "#B70B4F", "#67001F"],
-                                "name": "PuRd",
-                                "type": "sequential",
-                                "category": "ColorBrewer"
-                            },
-                            "strokeColorRange": {
-                                "name": "Global Warming",
-                                "type": "sequential",
-                                "category": "Uber",
-                                "colors": ["#4C0035", "#880030", "#B72F15", "#D6610A", "#EF9100", "#FFC300"]
-                            },
-                            "radius": 13.7,
-                            "sizeRange": [0, 10],
-                            "radiusRange": [0, 50],
-                            "heightRange": [0, 500],
-                            "elevationScale": 5,
-                            "stroked": False,
-                            "filled": True,
-                            "enable3d": False,
-                            "wireframe": False,
-                            "fixedHeight": False
-                        },
-                        "hidden": False,
-                        "textLabel": [
-                            {
-                                "field": None,
-                                "color": [255, 255, 255],
-                                "size": 18,
-                                "offset": [0, 0],
-                                "anchor": "start",
-                                "alignment": "center",
-                                "outlineWidth": 0,
-                                "outlineColor": [255, 0, 0, 255],
-                                "background": False,
-                                "backgroundColor": [0, 0, 200, 255]
-                            }
-                        ]
-                    },
-                    "visualChannels": {
-                        "colorField": {"name": "price", "type": "integer"},
-                        "colorScale": "quantize",
-                        "strokeColorField": None,
-                        "strokeColorScale": "quantile",
-                        "sizeField": None,
-                        "sizeScale": "linear",
-                        "heightField": None,
-                        "heightScale": "linear",
-                        "radiusField": None,
-                        "radiusScale": "linear"
-                    }
-                },
-                {
-                    "id": "92v23lj",
-                    "type": "geojson",
-                    "config": {
-                        "dataId": "ecbukq",
-                        "columnMode": "geojson",
-                        "label": "beijing_services",
-                        "color": [246, 209, 138],
-                        "highlightColor": [252, 242, 26, 255],
-                        "columns": {"geojson": "_geojson"},
-                        "isVisible": True,
-                        "visConfig": {
-                            "opacity": 0.77,
-                            "strokeOpacity": 0.8,
-                            "thickness": 2.1,
-                            "strokeColor": [36, 115, 189],
-                            "colorRange": {
-                                "colors": ["#EE7733", "#0077BB", "#33BBEE", "#EE3377", "#CC3311", "#009988"],
-                                "name": "Tol Vibrant",
-                                "type": "qualitative",
-                                "category": "ColorBlind"
-                            },
-                            "strokeColorRange": {
-                                "name": "Global Warming",
-                                "type": "sequential",
-                                "category": "Uber",
-                                "colors": ["#4C0035", "#880030", "#B72F15", "#D6610A", "#EF9100", "#FFC300"]
-                            },
-                            "radius": 0,
-                            "sizeRange": [0, 10],
-                            "radiusRange": [0, 50],
-                            "heightRange": [0, 500],
-                            "elevationScale": 5,
-                            "stroked": False,
-                            "filled": True,
-                            "enable3d": False,
-                            "wireframe": False,
-                            "fixedHeight": False
-                        },
-                        "hidden": False,
-                        "textLabel": [
-                            {
-                                "field": None,
-                                "color": [255, 255, 255],
-                                "size": 18,
-                                "offset": [0, 0],
-                                "anchor": "start",
-                                "alignment": "center",
-                                "outlineWidth": 0,
-                                "outlineColor": [255, 0, 0, 255],
-                                "background": False,
-                                "backgroundColor": [0, 0, 200, 255]
-                            }
-                        ]
-                    },
-                    "visualChannels": {
-                        "colorField": {"name": "amenity", "type": "string"},
-                        "colorScale": "ordinal",
-                        "strokeColorField": None,
-                        "strokeColorScale": "quantile",
-                        "sizeField": None,
-                        "sizeScale": "linear",
-                        "heightField": None,
-                        "heightScale": "linear",
-                        "radiusField": None,
-                        "radiusScale": "linear"
-                    }
-                },
-                {
-                    "id": "2hrwpmd",
-                    "type": "geojson",
-                    "config": {
-                        "dataId": "-kgmb4t",
-                        "columnMode": "geojson",
-                        "label": "beijing_metro",
-                        "color": [87, 57, 33],
-                        "highlightColor": [252, 242, 26, 255],
-                        "columns": {"geojson": "_geojson"},
-                        "isVisible": True,
-                        "visConfig": {
-                            "opacity": 0.8,
-                            "strokeOpacity": 0.8,
-                            "thickness": 8.9,
-                            "strokeColor": [253, 236, 0],
-                            "colorRange": {
-                                "name": "Global Warming",
-                                "type": "sequential",
-                                "category": "Uber",
-                                "colors": ["#4C0035", "#880030", "#B72F15", "#D6610A", "#EF9100", "#FFC300"]
-                            },
-                            "strokeColorRange": {
-                                "name": "Global Warming",
-                                "type": "sequential",
-                                "category": "Uber",
-                                "colors": ["#4C0035", "#880030", "#B72F15", "#D6610A", "#EF9100", "#FFC300"]
-                            },
-                            "radius": 10,
-                            "sizeRange": [0, 10],
-                            "radiusRange": [0, 50],
-                            "heightRange": [0, 500],
-                            "elevationScale": 0,
-                            "stroked": True,
-                            "filled": True,
-                            "enable3d": False,
-                            "wireframe": False,
-                            "fixedHeight": False
-                        },
-                        "hidden": False,
-                        "textLabel": [
-                            {
-                                "field": None,
-                                "color": [255, 255, 255],
-                                "size": 18,
-                                "offset": [0, 0],
-                                "anchor": "start",
-                                "alignment": "center",
-                                "outlineWidth": 0,
-                                "outlineColor": [255, 0, 0, 255],
-                                "background": False,
-                                "backgroundColor": [0, 0, 200, 255]
-                            }
-                        ]
-                    },
-                    "visualChannels": {
-                        "colorField": None,
-                        "colorScale": "quantile",
-                        "strokeColorField": None,
-                        "strokeColorScale": "quantile",
-                        "sizeField": None,
-                        "sizeScale": "linear",
-                        "heightField": None,
-                        "heightScale": "linear",
-                        "radiusField": None,
-                        "radiusScale": "linear"
-                    }
-                }
-            ],
-            "effects": [],
-            "interactionConfig": {
-                "tooltip": {
-                    "fieldsToShow": {
-                        "-42kwdt": [
-                            {
-                                "name": "Lng",
-                                "format": None
-                            },
-                            {
-                                "name": "Lat",
-                                "format": None
-                            }
-                        ],
-                        "-kgmb4t": [
-                            {
-                                "name": "@id",
-                                "format": None
-                            },
-                            {
-                                "name": "area",
-                                "format": None
-                            },
-                            {
-                                "name": "indoor",
-                                "format": None
-                            },
-                            {
-                                "name": "layer",
-                                "format": None
-                            },
-                            {
-                                "name": "level",
-                                "format": None
-                            }
-                        ],
-                        "ecbukq": [
-                            {
-                                "name": "@id",
-                                "format": None
-                            },
-                            {
-                                "name": "amenity",
-                                "format": None
-                            },
-                            {
-                                "name": "name",
-                                "format": None
-                            },
-                            {
-                                "name": "name:zh",
-                                "format": None
-                            },
-                            {
-                                "name": "name:zh-Hans",
-                                "format": None
-                            }
-                        ],
-                        "3wuqo5": [
-                            {
-                                "name": "url",
-                                "format": None
-                            },
-                            {
-                                "name": "id",
-                                "format": None
-                            },
-                            {
-                                "name": "Lng",
-                                "format": None
-                            },
-                            {
-                                "name": "Lat",
-                                "format": None
-                            },
-                            {
-                                "name": "Cid",
-                                "format": None
-                            }
-                        ]
-                    },
-                    "compareMode": False,
-                    "compareType": "absolute",
-                    "enabled": False
-                },
-                "brush": {"size": 0.5, "enabled": False},
-                "geocoder": {"enabled": False},
-                "coordinate": {"enabled": False}
-            },
-            "layerBlending": "normal",
-            "overlayBlending": "normal",
-            "splitMaps": [],
-            "animationConfig": {"currentTime": None, "speed": 1},
-            "editor": {"features": [], "visible": True}
-        },
-        "mapState": {
-            "bearing": 0,
-            "dragRotate": False,
-            "latitude": 39.92836694172162,
-            "longitude": 116.3764795575669,
-            "pitch": 0,
-            "zoom": 9.827295162832453,
-            "isSplit": False,
-            "isViewportSynced": True,
-            "isZoomLocked": False,
-            "splitMapViewports": []
-        },
-        "mapStyle": {
-            "styleType": "satellite",
-            "topLayerGroups": {},
-            "visibleLayerGroups": {
-                "label": True,
-                "road": True,
-                "border": True,
-                "building": True,
-                "water": True,
-                "land": True,
-                "3d building": False
-            },
-            "threeDBuildingColor": [4.179000818945631, 7.370237807958659, 14.816457448989057],
-            "backgroundColor": [0, 0, 0],
-            "mapStyles": {}
-        },
-        "uiState": {
-            "mapControls": {
-                "mapLegend": {
-                    "active": True,
-                    "settings": {
-                        "position": {"x": 35, "anchorX": "right", "y": 66, "anchorY": "bottom"},
-                        "contentHeight": 351.8125
-                    }
-                }
-            }
-        }
-    }
-}
-# --- Creación de gráficos ---
-def update_fig_layout(fig, y_title):
-    fig.update_traces(mode='lines+markers', marker=dict(size=10, line=dict(width=2, color='DarkSlateGrey')))
-    fig.update_layout(xaxis_title='Año', yaxis_title=y_title)
-    return fig
-
-fig_migracion = update_fig_layout(px.line(migracion, x='Year', y='Net Migration', title='Migración neta de China'), 'Migración neta')
-fig_crecimiento = update_fig_layout(px.line(crecimiento, x='Año', y='Tasa_crecimiento', title='Crecimiento urbano de China'), 'Tasa de crecimiento urbano(%)')
-fig_pib = update_fig_layout(px.line(pib, x='Año', y='Tasa PIB', title='Tasa de crecimiento del PIB de China'), 'Tasa PIB(%)')
-
-# Gráficos de composición de vivienda
-def create_composicion_charts():
-    tipos_de_vivienda = composicion[composicion["Item"].isin([
-        "Viviendas Individuales de Varios Pisos", "Viviendas Individuales de Una Planta",
-        "Apartamento de Cuatro o Más Habitaciones", "Apartamento de Tres Habitaciones",
-        "Apartamento de Dos Habitaciones", "Apartamento de Una Habitación",
-        "Apartamento Tipo Tubo o Agrupado Estrechamente", "Viviendas de Una Planta", "Otros"
-    ])]
-
-    fuentes_de_vivienda = composicion[composicion["Item"].isin([
-        "Viviendas Públicas Alquiladas", "Viviendas Privadas Alquiladas", "Viviendas Autoconstruidas",
-        "Viviendas Comerciales Compradas", "Viviendas Compradas de la Reforma de Vivienda",
-        "Viviendas de Indemnización Compradas", "Viviendas de Reasentamiento", "Viviendas por Herencia o Donación",
-        "Viviendas Prestadas Gratuitamente", "Viviendas Gratuitas Suministradas por Empleadores", "Otros"
-    ])]
-
-    fig1 = px.bar(tipos_de_vivienda,
-                  x="Item",
-                  y=['Ciudad Entera', 'Viviendas Urbanas', 'Viviendas rurales'],
-                  title="Comparación de Tipos de Vivienda",
-                  labels={"Item": "Tipo de Vivienda", "value": "Porcentaje", "variable": "Categoría"},
-                  barmode="group")
-    fig1.update_xaxes(tickangle=45)
-    fig1.update_traces(marker=dict(line=dict(width=0.5, color='black')))
-    fig1.update_layout(width=800, height=600, margin=dict(l=40, r=40, t=40, b=80))
-
-    fig2 = px.bar(fuentes_de_vivienda,
-                  x="Item",
-                  y=['Ciudad Entera', 'Viviendas Urbanas', 'Viviendas rurales'],
-                  title="Comparación de Fuentes de Vivienda",
-                  labels={"Item": "Fuente de Vivienda", "value": "Porcentaje", "variable": "Categoría"},
-                  barmode="group")
-    fig2.update_xaxes(tickangle=45)
-    fig2.update_traces(marker=dict(line=dict(width=0.5, color='black')))
-    fig2.update_layout(width=800, height=600, margin=dict(l=40, r=40, t=40, b=80))
-
-    return fig1, fig2
-
-fig_tipos_vivienda, fig_fuentes_vivienda = create_composicion_charts()
+
+def partition_filters(version):
+    valores = load_partition_values(version)
+    distritos, anios = valores['district'], valores['year']
+    with st.sidebar:
+        st.markdown("### Particiones de anuncios")
+        elegidos = st.multiselect("Distritos", distritos, default=distritos[:1],
+                                  help="Solo se cargan los anuncios de los distritos elegidos.")
+        rango = (anios[0], anios[-1]) if anios else (0, 0)
+        if rango[0] < rango[1]:
+            rango = st.slider("Año de venta", rango[0], rango[1], rango)
+    return tuple(elegidos), rango
+
+@cached_stage('build_listing_index', st.cache_resource)
+def build_listing_index(version, excluded, _df):
+    return ListingIndex(_df,
+                        numeric=[c for c in FILTROS_RANGO if c in _df.columns],
+                        categorical=[c for c in FILTROS_CATEGORIA if c in _df.columns and c not in excluded])
+
+def listing_filters(listing_index):
+    rangos = {}
+    categorias = {}
+    with st.sidebar:
+        st.markdown("### Filtros de anuncios")
+        for column, label in FILTROS_RANGO.items():
+            if column not in listing_index.numeric_columns:
+                continue
+            low, high = listing_index.value_range(column)
+            default = (int(np.floor(low)), int(np.ceil(high)))
+            if default[0] == default[1]:
+                continue
+            selected = st.slider(label, default[0], default[1], default)
+            if selected != default:
+                rangos[column] = selected
+        for column, label in FILTROS_CATEGORIA.items():
+            if column not in listing_index.categorical_columns:
+                continue
+            selected = st.multiselect(label, listing_index.categories(column), placeholder="Todos")
+            if selected:
+                categorias[column] = selected
+    return rangos, categorias
+
+# --- Mapa: capas recortadas al viewport inicial y HTML cacheado (cache_mapa.py) ---
+ALTURA_MAPA = 600
+
+def map_layers(datos, versiones, modo_precios, filas, filter_key, ancho_banda=None):
+    map_state = config_mapa['config']['mapState']
+    bounds = viewport_bounds(map_state, height=ALTURA_MAPA)
+    layers = {}
+    if datos.services is not None:
+        layers['ecbukq'] = cull_layer(datos.services, 'ecbukq', versiones['services'], bounds)
+    if datos.metro is not None:
+        layers['-kgmb4t'] = cull_layer(datos.metro, '-kgmb4t', versiones['metro'], bounds)
+    if datos.listados is not None:
+        precios_version = versiones['listados']
+        if modo_precios == "Cuadrícula":
+            resolution = resolution_for_zoom(map_state['zoom'])
+            precios_mapa = load_price_grid(precios_version, resolution, filter_key, datos.listados, filas)
+            precios_key = f'{precios_version}:grid{resolution}:{hash(filter_key)}'
+            layers['-42kwdt'] = cull_layer(precios_mapa, '-42kwdt', precios_key, bounds)
+        elif modo_precios == "Densidad":
+            resolution = surface_resolution(resolution_for_zoom(map_state['zoom']))
+            precios_mapa = load_density(precios_version, resolution, ancho_banda, filter_key, datos.listados, filas)
+            precios_key = f'{precios_version}:densidad{resolution}:{ancho_banda}:{hash(filter_key)}'
+            layers['-42kwdt'] = cull_layer(precios_mapa, '-42kwdt', precios_key, bounds)
+        else:
+            layers['-42kwdt'] = cull_layer(datos.listados, '-42kwdt', precios_version, bounds,
+                                           within=filas)[list(COLUMNAS_MAPA)]
+    return layers
+
+# En un acierto no se recortan capas ni se construye el KeplerGl: se sirve el HTML guardado
+def map_html(datos, versiones, modo_precios, filas, filter_key, ancho_banda=None):
+    key = render_key(
+        {name: versiones[name] for name in ('services', 'metro', 'listados')},
+        config_mapa,
+        {'modo': modo_precios, 'ancho_banda': ancho_banda, 'filtros': filter_key, 'max_features': MAX_FEATURES_MAPA,
+         'arrow': TRANSPORTE_BINARIO and supports_arrow(), 'height': ALTURA_MAPA},
+    )
+
+    def render():
+        kepler_map = build_kepler_map(map_layers(datos, versiones, modo_precios, filas, filter_key, ancho_banda),
+                                      height=ALTURA_MAPA)
+        with medir('kepler:render_html'):
+            return kepler_map._repr_html_()
+
+    with medir('map_html'):
+        return get_html(key, render)
+
+def _prewarm_map(datos, versions):
+    try:
+        map_html(datos, versions, "Anuncios", None, ((), ()))
+    except Exception:
+        logger.exception('No se pudo precalentar el mapa')
+
+# Vista por defecto (anuncios sin filtros), la que pide casi todo el tráfico; solo con DASHBOARD_MAPA_PRECALENTAR=1.
+# Se renderiza en un hilo aparte, una vez por proceso y versión de los datos, para que la visita
+# que lo lanza no espere; si abre el mapa antes de que termine, lo renderiza ella misma
+@cached_stage('prewarm_map', st.cache_resource)
+def prewarm_map(versions, _datos):
+    thread = threading.Thread(target=_prewarm_map, args=(_datos, dict(versions)), name='prewarm_map', daemon=True)
+    add_script_run_ctx(thread)
+    thread.start()
+    return thread
 
 # --- Diseño del Dashboard ---
 st.title('Análisis Contextual del Mercado Inmobiliario de Pekín')
 
-tab1, tab2, tab3, tab4 = st.tabs(["Migración y Crecimiento", "PIB", "Composición de Vivienda", "Mapa"])
-
-with tab1:
-    col1, col2 = st.columns(2)
-    with col1:
-        st.plotly_chart(fig_migracion)
-    with col2:
-        st.plotly_chart(fig_crecimiento)
-
-with tab2:
-    st.plotly_chart(fig_pib)
-
-with tab3:
-    st.plotly_chart(fig_tipos_vivienda)
-    st.plotly_chart(fig_fuentes_vivienda)
-
-with tab4:
+# Solo se ejecuta la sección seleccionada: con st.tabs cada rerun construiría todas
+SECCIONES = ["Migración y Crecimiento", "PIB", "Comparación", "Composición de Vivienda", "Precios", "Mapa"]
+# Sección oculta: solo aparece con DASHBOARD_RENDIMIENTO=1
+if RENDIMIENTO:
+    SECCIONES.append("Rendimiento")
+seccion = st.radio("Sección", SECCIONES, horizontal=True, label_visibility="collapsed")
+
+versiones = dataset_versions()
+# Solo el mapa (y su precalentado) usa la tabla de anuncios; Precios lee el cubo por su cuenta
+carga = load_datasets(versiones, listados=seccion == "Mapa" or PRECALENTAR)
+show_load_errors(carga)
+datos = carga.datasets
+if PRECALENTAR:
+    prewarm_map(tuple(sorted(versiones.items())), datos)
+
+if seccion == "Migración y Crecimiento":
+    if datos.wdi is not None:
+        fig_migracion, fig_crecimiento = get_migracion_charts(versiones['wdi'], datos.wdi)
+        col1, col2 = st.columns(2)
+        with col1:
+            st.plotly_chart(fig_migracion)
+        with col2:
+            st.plotly_chart(fig_crecimiento)
+
+elif seccion == "PIB":
+    if datos.wdi is not None:
+        st.plotly_chart(get_pib_chart(versiones['wdi'], datos.wdi))
+
+elif seccion == "Comparación":
+    if datos.wdi is not None:
+        matrices = build_wdi_matrices(versiones['wdi'], datos.wdi)
+        indicadores = [code for code in INDICADORES if code in matrices.values]
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            indicador = st.selectbox("Indicador", indicadores, format_func=INDICADORES.get)
+        with col2:
+            metrica = st.selectbox("Serie", list(METRICAS), format_func=METRICAS.get)
+        with col3:
+            grupo = st.selectbox("Grupo de referencia", list(GRUPOS))
+        nombres = dict(zip(matrices.countries, matrices.names))
+        paises = st.multiselect("Países", list(matrices.countries), default=[code for code in GRUPOS[grupo] if code in nombres],
+                                format_func=lambda code: f"{nombres[code]} ({code})")
+        valores = derived_matrix(versiones['wdi'], indicador, metrica, grupo if metrica == 'percentil' else None, matrices)
+        titulo = f"{INDICADORES[indicador]}: {METRICAS[metrica].lower()}"
+        if metrica == 'percentil':
+            titulo += f" ({grupo})"
+        st.plotly_chart(create_comparacion_chart(matrices.to_frame(valores, paises), titulo, METRICAS[metrica]))
+
+elif seccion == "Composición de Vivienda":
+    if datos.composicion is not None:
+        fig_tipos_vivienda, fig_fuentes_vivienda = get_composicion_charts(versiones['composicion'], datos.composicion)
+        st.plotly_chart(fig_tipos_vivienda)
+        st.plotly_chart(fig_fuentes_vivienda)
+
+elif seccion == "Precios":
+    cubo = load_cube(versiones['precios'])
+    if cubo is not None and len(cubo):
+        metrica = st.radio("Métrica", ["Precio por m²", "Precio total"], horizontal=True)
+        opciones_distrito = district_options(cubo)
+        distritos = st.multiselect("Distritos", opciones_distrito, placeholder="Todos")
+        primer_anio, ultimo_anio = int(cubo['year'].min()), int(cubo['year'].max())
+        anios = st.slider("Años", primer_anio, ultimo_anio, (primer_anio, ultimo_anio)) \
+            if primer_anio < ultimo_anio else (primer_anio, ultimo_anio)
+        anio_detalle = st.selectbox("Detalle mensual", list(range(anios[1], anios[0] - 1, -1)))
+        mostrados = distritos or opciones_distrito
+        fig_mediana, fig_percentiles, fig_recuento, fig_mensual = get_precios_charts(
+            tuple(distritos), tuple(sorted(district_versions('precios_clean.csv', mostrados).items())),
+            'price' if metrica == "Precio por m²" else 'total_price', anios, anio_detalle, cubo)
+        st.plotly_chart(fig_mediana)
+        col1, col2 = st.columns(2)
+        with col1:
+            st.plotly_chart(fig_percentiles)
+        with col2:
+            st.plotly_chart(fig_recuento)
+        st.plotly_chart(fig_mensual)
+
+        resumen = load_district_stats(versiones['precios'])
+        if resumen is not None:
+            st.markdown("#### Resumen por distrito")
+            resumen = resumen[['count', 'mean_price', 'std_price']].round(0)
+            st.dataframe(resumen.rename(columns={'count': 'Anuncios', 'mean_price': 'Precio medio (¥/m²)',
+                                                 'std_price': 'Desviación típica (¥/m²)'}))
+
+elif seccion == "Mapa":
     st.markdown("### Mapa Interactivo: Servicios Urbanos y Transporte en Pekín")
 
-    # Inicializar el mapa de Kepler.gl con la configuración
-    kepler_map = KeplerGl(height=600, config=config_mapa)
-
-    # Agregar datos al mapa
-    if beijing_services_gdf is not None:
-        kepler_map.add_data(data=beijing_services_gdf, name='ecbukq')
-    if beijing_metro_gdf is not None:
-        kepler_map.add_data(data=beijing_metro_gdf, name='-kgmb4t')
+    modo_precios = st.radio("Capa de precios", ["Anuncios", "Cuadrícula", "Densidad"], horizontal=True,
+                            help="Cuadrícula agrega los anuncios por celda (mediana, media y percentiles de precio). "
+                                 "Densidad muestra el precio medio suavizado con un núcleo gaussiano, en bandas.")
+    ancho_banda = None
+    if modo_precios == "Densidad":
+        ancho_banda = st.select_slider("Ancho de banda (m)", ANCHOS_BANDA, value=ANCHOS_BANDA[1])
+
+    precios_clean_df = datos.listados
+    versiones_mapa = versiones
+    excluidos = ()
+    if listados_particionados():
+        distritos, anios = partition_filters(versiones['listados'])
+        precios_clean_df = load_listados_vista(versiones['listados'], distritos, anios) if distritos else None
+        if not distritos:
+            st.info("Elige al menos un distrito en la barra lateral para ver sus anuncios.")
+        # Las capas derivadas de los anuncios se cachean por vista (particiones elegidas)
+        versiones_mapa = {**versiones, 'listados': f"{versiones['listados']}:{distritos}:{anios}"}
+        excluidos = ('district',)
+    filas = None
+    filter_key = ((), ())
     if precios_clean_df is not None:
-        kepler_map.add_data(data=precios_clean_df, name='-42kwdt')
-
-    # Mostrar el mapa en Streamlit
-    keplergl_static(kepler_map)
+        listing_index = build_listing_index(versiones_mapa['listados'], excluidos, precios_clean_df)
+        rangos, categorias = listing_filters(listing_index)
+        with medir('listing_filters'):
+            filas = listing_index.query(rangos, categorias)
+        filter_key = (tuple(sorted(rangos.items())), tuple(sorted((c, tuple(v)) for c, v in categorias.items())))
+
+    html = map_html(datos._replace(listados=precios_clean_df), versiones_mapa, modo_precios, filas, filter_key,
+                    ancho_banda)
+
+    # Mostrar el mapa en Streamlit (lo mismo que keplergl_static, pero con el HTML ya generado)
+    with medir('map_display'):
+        components.html(html.decode('utf-8'), height=ALTURA_MAPA + 10)
+    if RENDIMIENTO:
+        record_bytes('kepler_html', len(html))
+
+elif seccion == "Rendimiento":
+    st.markdown("### Rendimiento del proceso actual")
+    metricas = snapshot()
+    etapas = pd.DataFrame.from_dict(metricas['stages'], orient='index')
+    if len(etapas):
+        st.dataframe(etapas.drop(columns=['histogram']))
+        etapa = st.selectbox("Histograma de latencias", list(etapas.index))
+        st.bar_chart(pd.Series(metricas['stages'][etapa]['histogram'], name='llamadas'))
+    st.markdown("#### Carga inicial")
+    st.caption(f"Tiempo de pared: {carga.wall:.2f} s · suma secuencial: {sum(carga.timings.values()):.2f} s")
+    st.dataframe(pd.Series(carga.timings, name='segundos'))
+    st.markdown("#### Cachés")
+    st.dataframe(pd.DataFrame.from_dict(metricas['caches'], orient='index'))
+    st.markdown("#### Payload")
+    st.dataframe(pd.DataFrame.from_dict(metricas['payloads'], orient='index'))
+    # Lee /proc/self/smaps: solo aquí, no en cada rerun del mapa
+    st.markdown("#### Memoria de los datasets")
+    st.dataframe(store.report())
+    st.download_button("Exportar JSON", export_json(), file_name='rendimiento.json', mime='application/json')
 
  
  # Expanders para información adicional (opcional)
@@ -0,0 +1,147 @@
+import math
+from typing import NamedTuple
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from agregacion import cell_size
+from espacial import BOUNDS_PEKIN
+from piramide import LAT_REFERENCIA
+
+
+# Tamaño aproximado de cada píxel de la superficie en pantalla
+DENSIDAD_PIXELS = 8
+
+# Anchos de banda (m) ofrecidos en el mapa
+ANCHOS_BANDA = (250, 500, 1000, 2000)
+
+# Tope de celdas de la rejilla; por encima se baja la resolución
+MAX_CELDAS = 2_000_000
+
+# El núcleo gaussiano se trunca a este número de sigmas
+TRUNCADO_SIGMAS = 3
+
+# Peso gaussiano mínimo (≈ anuncios efectivos) para que una celda tenga precio
+PESO_MINIMO = 0.5
+
+N_BANDAS = 12
+
+METROS_GRADO_LAT = 110_574
+
+
+class Superficie(NamedTuple):
+    x_edges: np.ndarray
+    y_edges: np.ndarray
+    # (ny, nx): precio medio ponderado por el núcleo (NaN sin datos suficientes) y peso acumulado
+    price: np.ndarray
+    weight: np.ndarray
+
+
+def grid_edges(resolution, bounds=BOUNDS_PEKIN, pixels=DENSIDAD_PIXELS):
+    # Bordes alineados a múltiplos del tamaño de celda: la rejilla no depende de los datos
+    size = cell_size(resolution, pixels)
+    minx, miny = math.floor(bounds[0] / size), math.floor(bounds[1] / size)
+    maxx, maxy = math.ceil(bounds[2] / size), math.ceil(bounds[3] / size)
+    return np.arange(minx, maxx + 1) * size, np.arange(miny, maxy + 1) * size
+
+
+def surface_resolution(resolution, bounds=BOUNDS_PEKIN, max_cells=MAX_CELDAS):
+    while resolution > 0:
+        x_edges, y_edges = grid_edges(resolution, bounds)
+        if (len(x_edges) - 1) * (len(y_edges) - 1) <= max_cells:
+            break
+        resolution -= 1
+    return resolution
+
+
+def _gaussian_kernel(sigma):
+    radius = max(1, int(math.ceil(TRUNCADO_SIGMAS * sigma)))
+    x = np.arange(-radius, radius + 1, dtype=np.float64)
+    kernel = np.exp(-0.5 * (x / sigma) ** 2)
+    return kernel / kernel.sum()
+
+
+def gaussian_smooth(grids, sigma_x, sigma_y):
+    """Convolución gaussiana de cada rejilla de `grids` (..., ny, nx) mediante FFT.
+
+    El núcleo es el producto exterior de dos gaussianas 1D; el relleno con ceros evita
+    que la convolución circular mezcle bordes opuestos.
+    """
+    kx = _gaussian_kernel(sigma_x)
+    ky = _gaussian_kernel(sigma_y)
+    ny, nx = grids.shape[-2:]
+    shape = (ny + len(ky) - 1, nx + len(kx) - 1)
+    spectrum = np.fft.rfft2(grids, s=shape) * np.fft.rfft2(np.outer(ky, kx), s=shape)
+    full = np.fft.irfft2(spectrum, s=shape)
+    ry, rx = len(ky) // 2, len(kx) // 2
+    # El redondeo de la FFT deja valores negativos minúsculos donde no hay datos
+    return np.clip(full[..., ry:ry + ny, rx:rx + nx], 0, None)
+
+
+def price_surface(df, resolution, bandwidth_m, lng_col='Lng', lat_col='Lat', price_col='price'):
+    """Precio medio ponderado por un núcleo gaussiano de `bandwidth_m` metros en cada celda.
+
+    Los anuncios se acumulan una vez en la rejilla (histogram2d de sumas y de recuentos); el
+    suavizado y el cociente solo dependen del tamaño de la rejilla, no del número de anuncios.
+    """
+    x_edges, y_edges = grid_edges(resolution)
+    lng = df[lng_col].to_numpy(dtype=np.float64)
+    lat = df[lat_col].to_numpy(dtype=np.float64)
+    price = df[price_col].to_numpy(dtype=np.float64)
+    bins = [y_edges, x_edges]
+    sums, _, _ = np.histogram2d(lat, lng, bins=bins, weights=price)
+    counts, _, _ = np.histogram2d(lat, lng, bins=bins)
+
+    size = x_edges[1] - x_edges[0]
+    sigma_y = bandwidth_m / (size * METROS_GRADO_LAT)
+    sigma_x = sigma_y / math.cos(math.radians(LAT_REFERENCIA))
+    smooth_sums, weight = gaussian_smooth(np.stack([sums, counts]), sigma_x, sigma_y)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(weight >= PESO_MINIMO, smooth_sums / weight, np.nan)
+    return Superficie(x_edges, y_edges, mean.astype(np.float32), weight.astype(np.float32))
+
+
+def _cell_boxes(surface, iy, ix):
+    x_edges, y_edges = surface.x_edges, surface.y_edges
+    return shapely.box(x_edges[ix], y_edges[iy], x_edges[ix + 1], y_edges[iy + 1])
+
+
+def surface_cells(surface):
+    """Capa ráster: una celda por píxel con precio, coloreable por `price`."""
+    iy, ix = np.nonzero(~np.isnan(surface.price))
+    cells = pd.DataFrame({
+        'price': np.round(surface.price[iy, ix]).astype('int64'),
+        'weight': surface.weight[iy, ix].round(2),
+        'Lng': ((surface.x_edges[ix] + surface.x_edges[ix + 1]) / 2).astype('float32'),
+        'Lat': ((surface.y_edges[iy] + surface.y_edges[iy + 1]) / 2).astype('float32'),
+    })
+    return gpd.GeoDataFrame(cells, geometry=_cell_boxes(surface, iy, ix), crs='EPSG:4326')
+
+
+def surface_bands(surface, n_bands=N_BANDAS):
+    """Capa de contornos: las celdas se agrupan en `n_bands` bandas de precio por cuantiles
+    y cada banda se disuelve en un único (multi)polígono.
+    """
+    iy, ix = np.nonzero(~np.isnan(surface.price))
+    values = surface.price[iy, ix]
+    if not len(values):
+        return gpd.GeoDataFrame({'price': [], 'price_min': [], 'price_max': []},
+                                geometry=gpd.GeoSeries([], crs='EPSG:4326'))
+    edges = np.unique(np.quantile(values, np.linspace(0, 1, n_bands + 1)))
+    band = np.digitize(values, edges[1:-1])
+    boxes = _cell_boxes(surface, iy, ix)
+    size = surface.x_edges[1] - surface.x_edges[0]
+
+    rows, geometries = [], []
+    for b in np.unique(band):
+        selected = band == b
+        # Las celdas no se solapan y comparten bordes: coverage_union es mucho más rápido que union_all
+        geometries.append(shapely.simplify(shapely.coverage_union_all(boxes[selected]), size / 2))
+        rows.append({
+            'price': int(round(float(np.median(values[selected])))),
+            'price_min': int(round(float(values[selected].min()))),
+            'price_max': int(round(float(values[selected].max()))),
+        })
+    return gpd.GeoDataFrame(rows, geometry=geometries, crs='EPSG:4326')
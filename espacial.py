@@ -0,0 +1,99 @@
+import math
+
+import numpy as np
+from shapely import STRtree, box
+
+
+# Kepler/Mapbox usan teselas de 512 px
+TILE_SIZE = 512
+
+# Caja (minx, miny, maxx, maxy) en grados que cubre el municipio de Pekín
+BOUNDS_PEKIN = (115.4, 39.4, 117.6, 41.1)
+
+
+def viewport_bounds(map_state, width=1200, height=600, margin=1.25):
+    """Caja (minx, miny, maxx, maxy) en grados visible para un mapState de Kepler.
+
+    margin amplía la caja para que un desplazamiento pequeño no deje huecos en el mapa.
+    """
+    zoom = map_state['zoom']
+    world = TILE_SIZE * 2 ** zoom
+    half_w = width * margin / 2
+    half_h = height * margin / 2
+
+    lon = map_state['longitude']
+    lat = map_state['latitude']
+    x = (lon + 180) / 360 * world
+    y = (1 - math.log(math.tan(math.radians(lat)) + 1 / math.cos(math.radians(lat))) / math.pi) / 2 * world
+
+    def to_lon(px):
+        return px / world * 360 - 180
+
+    def to_lat(py):
+        n = math.pi * (1 - 2 * py / world)
+        return math.degrees(math.atan(math.sinh(n)))
+
+    return (
+        max(to_lon(x - half_w), -180.0),
+        max(to_lat(y + half_h), -85.0511),
+        min(to_lon(x + half_w), 180.0),
+        min(to_lat(y - half_h), 85.0511),
+    )
+
+
+def _cap(positions, max_features):
+    # Submuestreo uniforme para respetar el límite sin sesgar la distribución espacial
+    if max_features is None or len(positions) <= max_features:
+        return positions
+    take = np.linspace(0, len(positions) - 1, max_features).round().astype(np.int64)
+    return positions[take]
+
+
+class SpatialIndex:
+    """Índice espacial construido una vez sobre una capa del mapa.
+
+    Las GeoDataFrame usan un STRtree de shapely; las tablas de puntos (Lng/Lat)
+    se ordenan por longitud y se consultan con searchsorted, sin crear geometrías.
+    """
+
+    def __init__(self, data, lng_col='Lng', lat_col='Lat'):
+        if hasattr(data, 'geometry') and hasattr(data, 'crs'):
+            self._tree = STRtree(data.geometry.values)
+            self._order = None
+        else:
+            lng = data[lng_col].to_numpy(dtype=np.float64)
+            lat = data[lat_col].to_numpy(dtype=np.float64)
+            self._tree = None
+            self._order = np.argsort(lng, kind='stable')
+            self._lng = lng[self._order]
+            self._lat = lat[self._order]
+        self.size = len(data)
+
+    def query(self, bounds, max_features=None, within=None):
+        """Posiciones (para iloc) de las filas que intersectan bounds.
+
+        within restringe el resultado a esas posiciones (p. ej. el resultado de un filtro).
+        """
+        minx, miny, maxx, maxy = bounds
+        keep = None
+        if within is not None:
+            keep = np.zeros(self.size, dtype=bool)
+            keep[within] = True
+        if self._tree is not None:
+            positions = np.sort(self._tree.query(box(minx, miny, maxx, maxy), predicate='intersects'))
+            if keep is not None:
+                positions = positions[keep[positions]]
+            positions = _cap(positions, max_features)
+        else:
+            lo = np.searchsorted(self._lng, minx, side='left')
+            hi = np.searchsorted(self._lng, maxx, side='right')
+            in_lat = (self._lat[lo:hi] >= miny) & (self._lat[lo:hi] <= maxy)
+            candidates = self._order[lo:hi][in_lat]
+            if keep is not None:
+                candidates = candidates[keep[candidates]]
+            # El recorte se hace en orden de longitud para repartir la muestra por todo el viewport
+            positions = np.sort(_cap(candidates, max_features))
+        return positions
+
+    def cull(self, data, bounds, max_features=None, within=None):
+        return data.iloc[self.query(bounds, max_features, within)]
@@ -0,0 +1,106 @@
+import plotly.express as px
+
+from cubo import rollup
+from rendimiento import timed
+from wdi import wdi_serie
+
+
+# Creación de gráficos del dashboard, sin dependencias de Streamlit
+
+@timed('update_fig_layout')
+def update_fig_layout(fig, y_title):
+    fig.update_traces(mode='lines+markers', marker=dict(size=10, line=dict(width=2, color='DarkSlateGrey')))
+    fig.update_layout(xaxis_title='Año', yaxis_title=y_title)
+    return fig
+
+
+def macro_series(wdi):
+    migracion = wdi_serie(wdi, 'SM.POP.NETM', 'CHN', desde=1990).rename(columns={'year': 'Year', 'value': 'Net Migration'})
+    crecimiento = wdi_serie(wdi, 'SP.URB.TOTL.IN.ZS', 'CHN').rename(columns={'year': 'Año', 'value': 'Tasa_crecimiento'})
+    pib = wdi_serie(wdi, 'NY.GDP.MKTP.KD.ZG', 'CHN', desde=1990).rename(columns={'year': 'Año', 'value': 'Tasa PIB'})
+    return migracion, crecimiento, pib
+
+
+def create_migracion_charts(wdi):
+    migracion, crecimiento, _ = macro_series(wdi)
+    fig_migracion = update_fig_layout(px.line(migracion, x='Year', y='Net Migration', title='Migración neta de China'), 'Migración neta')
+    fig_crecimiento = update_fig_layout(px.line(crecimiento, x='Año', y='Tasa_crecimiento', title='Crecimiento urbano de China'), 'Tasa de crecimiento urbano(%)')
+    return fig_migracion, fig_crecimiento
+
+
+def create_pib_chart(wdi):
+    _, _, pib = macro_series(wdi)
+    return update_fig_layout(px.line(pib, x='Año', y='Tasa PIB', title='Tasa de crecimiento del PIB de China'), 'Tasa PIB(%)')
+
+
+# Gráficos de composición de vivienda
+@timed('create_composicion_charts')
+def create_composicion_charts(composicion):
+    tipos_de_vivienda = composicion[composicion["Item"].isin([
+        "Viviendas Individuales de Varios Pisos", "Viviendas Individuales de Una Planta",
+        "Apartamento de Cuatro o Más Habitaciones", "Apartamento de Tres Habitaciones",
+        "Apartamento de Dos Habitaciones", "Apartamento de Una Habitación",
+        "Apartamento Tipo Tubo o Agrupado Estrechamente", "Viviendas de Una Planta", "Otros"
+    ])]
+
+    fuentes_de_vivienda = composicion[composicion["Item"].isin([
+        "Viviendas Públicas Alquiladas", "Viviendas Privadas Alquiladas", "Viviendas Autoconstruidas",
+        "Viviendas Comerciales Compradas", "Viviendas Compradas de la Reforma de Vivienda",
+        "Viviendas de Indemnización Compradas", "Viviendas de Reasentamiento", "Viviendas por Herencia o Donación",
+        "Viviendas Prestadas Gratuitamente", "Viviendas Gratuitas Suministradas por Empleadores", "Otros"
+    ])]
+
+    fig1 = px.bar(tipos_de_vivienda,
+                  x="Item",
+                  y=['Ciudad Entera', 'Viviendas Urbanas', 'Viviendas rurales'],
+                  title="Comparación de Tipos de Vivienda",
+                  labels={"Item": "Tipo de Vivienda", "value": "Porcentaje", "variable": "Categoría"},
+                  barmode="group")
+    fig1.update_xaxes(tickangle=45)
+    fig1.update_traces(marker=dict(line=dict(width=0.5, color='black')))
+    fig1.update_layout(width=800, height=600, margin=dict(l=40, r=40, t=40, b=80))
+
+    fig2 = px.bar(fuentes_de_vivienda,
+                  x="Item",
+                  y=['Ciudad Entera', 'Viviendas Urbanas', 'Viviendas rurales'],
+                  title="Comparación de Fuentes de Vivienda",
+                  labels={"Item": "Fuente de Vivienda", "value": "Porcentaje", "variable": "Categoría"},
+                  barmode="group")
+    fig2.update_xaxes(tickangle=45)
+    fig2.update_traces(marker=dict(line=dict(width=0.5, color='black')))
+    fig2.update_layout(width=800, height=600, margin=dict(l=40, r=40, t=40, b=80))
+
+    return fig1, fig2
+
+
+# Gráficos de la pestaña de precios, leídos del cubo de estadísticas (cubo.py)
+ETIQUETAS_METRICA = {'price': 'Precio por m² (¥)', 'total_price': 'Precio total (¥)'}
+
+
+def create_precios_charts(cube, metric='price', districts=None, years=None, year=None):
+    label = ETIQUETAS_METRICA[metric]
+    anual = rollup(cube, by=('year', 'district'), metric=metric, districts=districts, years=years)
+    fig_mediana = update_fig_layout(px.line(anual, x='year', y='p50', color='district',
+                                            title=f'Mediana anual por distrito: {label}'), label)
+
+    total = rollup(cube, by=('year',), metric=metric, districts=districts, years=years)
+    fig_percentiles = px.line(total, x='year', y=['p25', 'p50', 'p75', 'p90'],
+                              title=f'Percentiles anuales: {label}',
+                              labels={'year': 'Año', 'value': label, 'variable': 'Percentil'})
+    fig_recuento = px.bar(total, x='year', y='count', title='Número de anuncios por año',
+                          labels={'year': 'Año', 'count': 'Anuncios'})
+
+    fig_mensual = None
+    if year is not None:
+        mensual = rollup(cube, by=('month', 'district'), metric=metric, districts=districts, years=(year, year))
+        fig_mensual = px.line(mensual, x='month', y='p50', color='district', markers=True,
+                              title=f'Mediana mensual por distrito en {year}: {label}',
+                              labels={'month': 'Mes', 'p50': label, 'district': 'Distrito'})
+    return fig_mediana, fig_percentiles, fig_recuento, fig_mensual
+
+
+# Comparación entre países: `frame` es la tabla larga (country, year, value) de WDIMatrices.to_frame
+def create_comparacion_chart(frame, title, y_title):
+    fig = px.line(frame, x='year', y='value', color='country', title=title,
+                  labels={'country': 'País', 'year': 'Año', 'value': y_title})
+    return update_fig_layout(fig, y_title)
@@ -0,0 +1,121 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+# Columnas categóricas con pocas categorías: se precalcula un bitmap por categoría
+MAX_CATEGORIAS_BITMAP = 64
+
+# Resultados de filtrado memorizados (posiciones de slider repetidas)
+MAX_RESULTADOS = 256
+
+
+class ListingIndex:
+    """Índices precalculados para filtrar los anuncios sin recorrer la tabla en cada rerun.
+
+    - Rangos numéricos: valores ordenados + searchsorted.
+    - Categorías: bitmaps empaquetados (pocas categorías) o listas de filas (muchas).
+    - La combinación de filtros es una intersección de bitmaps (np.bitwise_and).
+    """
+
+    def __init__(self, df, numeric=(), categorical=()):
+        self.size = len(df)
+        self._ranges = {}
+        self._extents = {}
+        for column in numeric:
+            values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64)
+            # Los NaN quedan al final del orden y nunca entran en un rango
+            order = np.argsort(values, kind='stable')
+            self._ranges[column] = (values[order], order)
+            valid = values[order][:np.count_nonzero(~np.isnan(values))]
+            self._extents[column] = (float(valid[0]), float(valid[-1])) if len(valid) else (0.0, 0.0)
+
+        self._bitmaps = {}
+        self._row_lists = {}
+        for column in categorical:
+            categories = df[column].astype('category')
+            codes = categories.cat.codes.to_numpy()
+            labels = [str(c) for c in categories.cat.categories]
+            if len(labels) <= MAX_CATEGORIAS_BITMAP:
+                self._bitmaps[column] = {
+                    label: np.packbits(codes == code) for code, label in enumerate(labels)
+                }
+            else:
+                order = np.argsort(codes, kind='stable')
+                bounds = np.searchsorted(codes[order], np.arange(len(labels) + 1))
+                self._row_lists[column] = {
+                    label: order[bounds[code]:bounds[code + 1]] for code, label in enumerate(labels)
+                }
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def numeric_columns(self):
+        return list(self._ranges)
+
+    @property
+    def categorical_columns(self):
+        return list(self._bitmaps) + list(self._row_lists)
+
+    def value_range(self, column):
+        return self._extents[column]
+
+    def categories(self, column):
+        source = self._bitmaps.get(column) or self._row_lists.get(column) or {}
+        return list(source)
+
+    def _rows_to_bitmap(self, rows):
+        mask = np.zeros(self.size, dtype=bool)
+        mask[rows] = True
+        return np.packbits(mask)
+
+    def _range_bitmap(self, column, low, high):
+        values, order = self._ranges[column]
+        lo = np.searchsorted(values, low, side='left')
+        hi = np.searchsorted(values, high, side='right')
+        return self._rows_to_bitmap(order[lo:hi])
+
+    def _category_bitmap(self, column, selected):
+        if column in self._bitmaps:
+            bitmaps = self._bitmaps[column]
+            empty = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+            return np.bitwise_or.reduce([bitmaps.get(label, empty) for label in selected] or [empty])
+        lists = self._row_lists[column]
+        rows = [lists[label] for label in selected if label in lists]
+        return self._rows_to_bitmap(np.concatenate(rows) if rows else np.empty(0, dtype=np.int64))
+
+    def query(self, ranges=None, categories=None):
+        """Posiciones (ordenadas) de las filas que cumplen todos los filtros.
+
+        ranges: {columna: (min, max)}; categories: {columna: [valores]}. Un filtro que cubre
+        todo el rango de la columna se omite. Devuelve None si no hay ningún filtro activo.
+        """
+        active_ranges = tuple(sorted(
+            (column, float(low), float(high)) for column, (low, high) in (ranges or {}).items()
+            if (low, high) != self.value_range(column)
+        ))
+        active_categories = tuple(sorted(
+            (column, frozenset(map(str, selected))) for column, selected in (categories or {}).items()
+            if selected is not None and set(map(str, selected)) != set(self.categories(column))
+        ))
+        if not active_ranges and not active_categories:
+            return None
+
+        key = (active_ranges, active_categories)
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+
+        bitmaps = [self._range_bitmap(column, low, high) for column, low, high in active_ranges]
+        bitmaps += [self._category_bitmap(column, selected) for column, selected in active_categories]
+        combined = np.bitwise_and.reduce(bitmaps)
+        rows = np.flatnonzero(np.unpackbits(combined, count=self.size))
+
+        with self._lock:
+            self._results[key] = rows
+            if len(self._results) > MAX_RESULTADOS:
+                self._results.popitem(last=False)
+        return rows
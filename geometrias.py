@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+
+import geopandas as gpd
+import numpy as np
+
+from artefactos import build_lock, cache_path, is_fresh, source_meta, source_version, tmp_path_for, write_meta
+
+try:
+    from pyogrio import read_dataframe
+except ImportError:
+    read_dataframe = None
+
+
+# UTM 50N: distancias y áreas en metros para Pekín
+CRS_METRICO = 'EPSG:32650'
+
+CRS_GEOGRAFICO = 'EPSG:4326'
+
+# Columnas precalculadas; en cada fichero están en el CRS de su geometría
+COLUMNAS_DERIVADAS = ['centroid_x', 'centroid_y', 'minx', 'miny', 'maxx', 'maxy']
+
+CACHE_VERSION = 2
+
+
+def _paths(file_path):
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return (
+        cache_path('geometrias', name, 'wgs84.parquet'),
+        cache_path('geometrias', name, 'metrico.parquet'),
+        cache_path('geometrias', name, 'meta.json'),
+    )
+
+
+def read_source(file_path):
+    """Lee el GeoJSON original por la vía Arrow de pyogrio; sin pyogrio, con gpd.read_file."""
+    if read_dataframe is not None:
+        try:
+            return read_dataframe(file_path, use_arrow=True)
+        except ImportError:
+            # pyogrio sin soporte Arrow (pyarrow ausente o GDAL < 3.6)
+            return read_dataframe(file_path)
+    return gpd.read_file(file_path)
+
+
+def _to_json(value):
+    return json.dumps(value, ensure_ascii=False, default=lambda v: v.tolist() if hasattr(v, 'tolist') else str(v))
+
+
+def _json_properties(gdf):
+    # Las propiedades con listas u objetos (p. ej. @relations) vuelven de GeoParquet y Arrow como
+    # ndarray, que el transporte en texto de Kepler no sabe serializar: se guardan como texto JSON
+    gdf = gdf.copy()
+    for column in gdf.columns:
+        if column == gdf.geometry.name or gdf[column].dtype != object:
+            continue
+        nested = gdf[column].map(lambda v: isinstance(v, (list, tuple, dict, np.ndarray))).to_numpy(dtype=bool)
+        if nested.any():
+            gdf[column] = gdf[column].astype(object)
+            gdf.loc[nested, column] = gdf.loc[nested, column].map(_to_json)
+    return gdf
+
+
+def _with_derived(gdf, centroids):
+    gdf = gdf.copy()
+    bounds = gdf.geometry.bounds
+    gdf['centroid_x'] = centroids.x.to_numpy()
+    gdf['centroid_y'] = centroids.y.to_numpy()
+    for column in ('minx', 'miny', 'maxx', 'maxy'):
+        gdf[column] = bounds[column].to_numpy()
+    return gdf
+
+
+def build_geometries(file_path):
+    """Persiste el GeoJSON como GeoParquet en WGS84 y en CRS_METRICO, con centroides y bounds.
+
+    Los centroides se calculan en el CRS métrico (en grados no son exactos) y se reproyectan
+    para la copia WGS84; así ningún consumidor tiene que reproyectar para medir.
+    """
+    wgs84_path, metrico_path, meta_path = _paths(file_path)
+    gdf = read_source(file_path)
+    if gdf.crs is None:
+        gdf = gdf.set_crs(CRS_GEOGRAFICO)
+    elif not gdf.crs.equals(CRS_GEOGRAFICO):
+        gdf = gdf.to_crs(CRS_GEOGRAFICO)
+    gdf = _json_properties(gdf)
+
+    projected = gdf.to_crs(CRS_METRICO)
+    centroids = projected.geometry.centroid
+    metrico = _with_derived(projected, centroids)
+    wgs84 = _with_derived(gdf, centroids.to_crs(CRS_GEOGRAFICO))
+
+    for data, out_path in ((wgs84, wgs84_path), (metrico, metrico_path)):
+        tmp_path = tmp_path_for(out_path)
+        data.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, out_path)
+    meta = source_meta(file_path, version=CACHE_VERSION, rows=len(gdf), crs_metrico=CRS_METRICO)
+    write_meta(meta_path, meta)
+    return meta
+
+
+def _cached_meta(file_path):
+    wgs84_path, metrico_path, meta_path = _paths(file_path)
+    fresh, meta = is_fresh(file_path, meta_path)
+    if not fresh or meta.get('version') != CACHE_VERSION or meta.get('crs_metrico') != CRS_METRICO \
+            or not os.path.exists(wgs84_path) or not os.path.exists(metrico_path):
+        return None
+    return meta
+
+
+def ensure_geometries(file_path):
+    meta = _cached_meta(file_path)
+    if meta is None:
+        # Metro, servicios y accesibilidad piden el mismo fichero a la vez con la caché fría:
+        # solo un hilo lo construye y el resto reutiliza su resultado
+        with build_lock(file_path):
+            meta = _cached_meta(file_path) or build_geometries(file_path)
+    return meta
+
+
+def geometry_version(file_path):
+    # Clave de caché de lo derivado de la caché GeoParquet: cambia con el fichero y con su formato
+    return f'{source_version(file_path)}:g{CACHE_VERSION}'
+
+
+def read_geometries(file_path, projected=False, derived=True):
+    """GeoDataFrame de `file_path` leído de la caché GeoParquet.
+
+    projected=True devuelve la copia en CRS_METRICO; derived=False omite las columnas
+    precalculadas (p. ej. para no enviarlas al mapa).
+    """
+    ensure_geometries(file_path)
+    wgs84_path, metrico_path, _ = _paths(file_path)
+    gdf = gpd.read_parquet(metrico_path if projected else wgs84_path)
+    if not derived:
+        gdf = gdf.drop(columns=COLUMNAS_DERIVADAS)
+    return gdf
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convierte GeoJSON a GeoParquet con copia proyectada, centroides y bounds.')
+    parser.add_argument('files', nargs='*', default=['beijing_metro.geojson', 'beijing_services.geojson'])
+    args = parser.parse_args()
+    for file_path in args.files:
+        meta = build_geometries(file_path)
+        print(file_path, f"{meta['rows']} geometrías")
@@ -0,0 +1,272 @@
+import argparse
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from artefactos import cache_path, file_lock, read_meta, source_version, tmp_path_for, write_meta
+from cubo import COLUMNAS_CUBO, build_cube, empty_cube, merge_cubes
+from listados import DTYPES_LISTADOS, coerce_listados, ensure_listados_cache, iter_batches, read_listados
+
+
+# Agregados mantenidos al aplicar deltas: sumas por distrito y el cubo de cuantiles (cubo.py)
+AGREGADOS = ('district', 'cubo')
+
+COLUMNAS_AGREGADOS = ['count', 'price_sum', 'price_sumsq']
+
+# Columnas de los listados que necesitan los agregados
+COLUMNAS_SEMILLA = ['id', *COLUMNAS_CUBO]
+
+# Columnas obligatorias de un delta: las de los agregados más las coordenadas del mapa
+COLUMNAS_DELTA = [*COLUMNAS_SEMILLA, 'Lng', 'Lat']
+
+CACHE_VERSION = 4
+
+
+def _delta_dir(file_path):
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.dirname(cache_path('listados', f'{name}.deltas', 'manifest.json'))
+
+
+def _manifest_path(file_path):
+    return os.path.join(_delta_dir(file_path), 'manifest.json')
+
+
+def _aggregate_path(file_path, kind, generation):
+    # Cada delta escribe una generación nueva; el manifiesto apunta a la vigente ('aggregates_version'),
+    # así que un corte antes de escribirlo deja los agregados anteriores intactos
+    return os.path.join(_delta_dir(file_path), f'agregados-{kind}-{generation:06d}.parquet')
+
+
+def _remove_generations(file_path, keep):
+    # Se conserva también la generación anterior por si un lector la acaba de resolver en el manifiesto
+    for path in glob.glob(os.path.join(_delta_dir(file_path), 'agregados-*.parquet')):
+        generation = os.path.splitext(path)[0].rsplit('-', 1)[-1]
+        if not generation.isdigit() or int(generation) not in keep:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _write_parquet(df, path):
+    tmp_path = tmp_path_for(path)
+    df.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def district_contributions(df):
+    price = df['price'].to_numpy(dtype=np.float64)
+    frame = pd.DataFrame({
+        'district': df['district'].astype('string').to_numpy(),
+        'count': 1,
+        'price_sum': price,
+        'price_sumsq': price * price,
+    })
+    return frame.groupby('district').sum()
+
+
+def _merge(kind, stats, added, removed=None):
+    # Solo sumas y recuentos: se pueden restar las filas antiguas sin recalcular nada
+    if kind == 'cubo':
+        cubes = [stats, added]
+        if removed is not None:
+            cubes.append(removed.assign(count=-removed['count']))
+        return merge_cubes(cubes)
+    stats = stats.add(added, fill_value=0)
+    if removed is not None:
+        stats = stats.sub(removed, fill_value=0)
+    return stats[stats['count'] > 0]
+
+
+def _contributions(df, kind):
+    if kind == 'cubo':
+        if not len(df) or not {'district', 'tradeTime', 'price'} <= set(df.columns):
+            return empty_cube()
+        return build_cube(df)
+    if not len(df) or 'district' not in df.columns:
+        return pd.DataFrame({c: pd.Series(dtype='float64') for c in COLUMNAS_AGREGADOS},
+                            index=pd.Index([], name='district'))
+    return district_contributions(df)
+
+
+def _seed_aggregates(file_path, manifest):
+    # Base por lotes (iter_batches) sin los anuncios que sustituye algún delta, más los deltas:
+    # los agregados se acumulan sin tener la tabla entera en memoria
+    deltas = _combine(_read_deltas(file_path, manifest, COLUMNAS_SEMILLA)) if manifest['deltas'] else None
+    stats = {kind: _contributions(pd.DataFrame(), kind) for kind in AGREGADOS}
+    for batch in iter_batches(file_path, columns=COLUMNAS_SEMILLA):
+        if deltas is not None:
+            batch = batch[~batch['id'].isin(deltas['id'])]
+        for kind in AGREGADOS:
+            stats[kind] = _merge(kind, stats[kind], _contributions(batch, kind))
+    if deltas is not None:
+        for kind in AGREGADOS:
+            stats[kind] = _merge(kind, stats[kind], _contributions(deltas, kind))
+    for kind, data in stats.items():
+        _write_parquet(data, _aggregate_path(file_path, kind, manifest['version']))
+
+
+def _current_manifest(file_path, base_sha):
+    manifest = read_meta(_manifest_path(file_path))
+    if (manifest is not None and manifest.get('base_sha256') == base_sha
+            and manifest.get('cache_version') == CACHE_VERSION):
+        return manifest
+    return None
+
+
+def _load_manifest(file_path, locked=False):
+    base_sha = ensure_listados_cache(file_path)['sha256']
+    manifest = _current_manifest(file_path, base_sha)
+    if manifest is not None:
+        return manifest
+    if not locked:
+        with file_lock(_manifest_path(file_path)):
+            return _load_manifest(file_path, locked=True)
+
+    # Con el lock: otro hilo o proceso puede haberlo regenerado mientras esperábamos
+    manifest = read_meta(_manifest_path(file_path))
+    if manifest is None or manifest.get('base_sha256') != base_sha:
+        for path in glob.glob(os.path.join(_delta_dir(file_path), '*.parquet')):
+            os.remove(path)
+        manifest = {'base_sha256': base_sha, 'version': 0, 'deltas': [], 'district_versions': {}}
+    _seed_aggregates(file_path, manifest)
+    manifest['cache_version'] = CACHE_VERSION
+    manifest['aggregates_version'] = manifest['version']
+    write_meta(_manifest_path(file_path), manifest)
+    _remove_generations(file_path, keep={manifest['version']})
+    return manifest
+
+
+def load_manifest(file_path):
+    """Manifiesto de deltas; se reinicia (y se recalculan los agregados) si el CSV base cambia.
+
+    Si solo cambia el formato de los agregados (CACHE_VERSION), se recalculan conservando los deltas.
+    La regeneración se hace con file_lock para no competir con apply_delta ni con otros workers.
+    """
+    return _load_manifest(file_path)
+
+
+def _read_deltas(file_path, manifest, columns=None, filters=None):
+    frames = []
+    for name in manifest['deltas']:
+        path = os.path.join(_delta_dir(file_path), name)
+        # Deltas anteriores a COLUMNAS_DELTA pueden no traer todas las columnas pedidas
+        present = columns if columns is None else [c for c in columns if c in pq.read_schema(path).names]
+        frames.append(pd.read_parquet(path, columns=present, filters=filters))
+    return frames
+
+
+def _combine(frames):
+    non_empty = [f for f in frames if len(f)]
+    if not non_empty:
+        return frames[0]
+    df = pd.concat(non_empty, ignore_index=True)
+    if 'id' in df.columns:
+        df = df.drop_duplicates(subset=['id'], keep='last')
+    for column, dtype in DTYPES_LISTADOS.items():
+        if column in df.columns:
+            df[column] = df[column].astype(dtype)
+    return df.reset_index(drop=True)
+
+
+def read_current(file_path, columns=None, filters=None):
+    """Listados base más los deltas aplicados; a igual id gana la versión más reciente."""
+    manifest = load_manifest(file_path)
+    read_columns = None if columns is None else list(dict.fromkeys(['id', *columns]))
+    base = read_listados(file_path, columns=read_columns, filters=filters)
+    if not manifest['deltas']:
+        return base if columns is None else base[list(columns)]
+    df = _combine([base, *_read_deltas(file_path, manifest, read_columns, filters)])
+    return df if columns is None else df[list(columns)]
+
+
+def dataset_version(file_path):
+    """Clave de caché del dataset: cambia con el CSV base y con cada delta aplicado."""
+    manifest = load_manifest(file_path)
+    return f"{manifest['base_sha256'][:12]}:{manifest['version']}"
+
+
+def dataset_stamp(file_path):
+    """Clave barata equivalente a dataset_version: mtime/tamaño del CSV y número de deltas del manifiesto.
+
+    No prepara la caché ni siembra los agregados, así que se puede calcular en cada rerun.
+    """
+    manifest = read_meta(_manifest_path(file_path)) or {}
+    return f"{source_version(file_path)}:{manifest.get('version', 0)}"
+
+
+def apply_delta(file_path, delta):
+    """Añade anuncios nuevos o modificados (clave `id`) y actualiza los agregados sin recalcularlos.
+
+    Devuelve la nueva versión del dataset. El delta y los agregados nuevos se escriben aparte y el
+    manifiesto (escritura atómica) los publica al final: si el proceso se corta antes, el estado anterior
+    sigue siendo consistente y el delta no se cuenta dos veces.
+    """
+    if isinstance(delta, str):
+        delta = pd.read_csv(delta, dtype={'url': 'string', 'id': 'string', 'Cid': 'string'}, low_memory=False)
+    missing = [c for c in COLUMNAS_DELTA if c not in delta.columns]
+    if missing:
+        raise ValueError(f"Faltan columnas en el delta: {', '.join(missing)}")
+    delta = coerce_listados(delta).drop_duplicates(subset=['id'], keep='last').reset_index(drop=True)
+
+    with file_lock(_manifest_path(file_path)):
+        manifest = _load_manifest(file_path, locked=True)
+        if not len(delta):
+            return manifest['version']
+        ids = delta['id'].astype(str).tolist()
+        # Versión vigente de los anuncios modificados, para descontar su contribución a los agregados
+        old = read_current(file_path, filters=[('id', 'in', ids)])
+
+        previous = manifest['aggregates_version']
+        version = manifest['version'] + 1
+        name = f'delta-{version:06d}.parquet'
+        _write_parquet(delta, os.path.join(_delta_dir(file_path), name))
+
+        for kind in AGREGADOS:
+            stats = pd.read_parquet(_aggregate_path(file_path, kind, previous))
+            merged = _merge(kind, stats, _contributions(delta, kind), _contributions(old, kind))
+            _write_parquet(merged, _aggregate_path(file_path, kind, version))
+
+        affected = set(delta['district'].astype(str)) | set(old['district'].astype(str))
+        manifest['version'] = version
+        manifest['aggregates_version'] = version
+        manifest['deltas'].append(name)
+        manifest['district_versions'].update({district: version for district in affected})
+        write_meta(_manifest_path(file_path), manifest)
+        _remove_generations(file_path, keep={previous, version})
+    return version
+
+
+def district_versions(file_path, districts):
+    """{distrito: versión}; cambia con el CSV base y con cada delta que toca ese distrito."""
+    manifest = load_manifest(file_path)
+    base = manifest['base_sha256'][:12]
+    return {district: f"{base}:{manifest['district_versions'].get(str(district), 0)}" for district in districts}
+
+
+def read_aggregates(file_path, kind='district'):
+    """Agregados mantenidos incrementalmente; los de distrito, con media y desviación típica del precio."""
+    manifest = load_manifest(file_path)
+    stats = pd.read_parquet(_aggregate_path(file_path, kind, manifest['aggregates_version']))
+    if kind == 'cubo':
+        return stats
+    stats['mean_price'] = stats['price_sum'] / stats['count']
+    variance = stats['price_sumsq'] / stats['count'] - stats['mean_price'] ** 2
+    stats['std_price'] = np.sqrt(variance.clip(lower=0))
+    return stats
+
+
+def read_cube(file_path='precios_clean.csv'):
+    """Cubo de cuantiles de precio (cubo.py) del dataset actual: base más deltas aplicados."""
+    return read_aggregates(file_path, 'cubo')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Aplica un CSV de anuncios nuevos o modificados al dataset.')
+    parser.add_argument('delta', help='CSV con el mismo esquema que precios_clean.csv')
+    parser.add_argument('--listados', default='precios_clean.csv')
+    args = parser.parse_args()
+    print(f'Versión {apply_delta(args.listados, args.delta)} ({dataset_version(args.listados)})')
@@ -0,0 +1,207 @@
+import argparse
+import hashlib
+import html
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+import plotly.io as pio
+
+from artefactos import read_meta, tmp_path_for, write_meta
+from cache_figuras import get_figures
+from espacial import SpatialIndex, viewport_bounds
+from figuras import create_composicion_charts, create_migracion_charts, create_pib_chart
+from geometrias import geometry_version, read_geometries
+from incremental import dataset_version, read_current
+from listados import COLUMNAS_MAPA
+from mapa import MAX_FEATURES_MAPA, TRANSPORTE_BINARIO, build_kepler_map, config_mapa
+from piramide import read_level
+from wdi import WDI_FILES, read_wdi
+
+
+FORMATOS = ('png', 'svg', 'html')
+
+# Tamaño de las imágenes estáticas
+ANCHO, ALTO, ESCALA = 1200, 600, 2
+
+TITULOS = {
+    'fig_migracion': 'Migración neta de China',
+    'fig_crecimiento': 'Crecimiento urbano de China',
+    'fig_pib': 'Tasa de crecimiento del PIB de China',
+    'fig_tipos_vivienda': 'Comparación de tipos de vivienda',
+    'fig_fuentes_vivienda': 'Comparación de fuentes de vivienda',
+    'mapa': 'Mapa de servicios urbanos, transporte y precios',
+}
+
+CACHE_VERSION = 1
+
+
+def figure_specs():
+    """Specs JSON de las figuras del dashboard, leídas de la caché de figuras (cache_figuras.py)."""
+    wdi = None
+
+    def load_wdi():
+        nonlocal wdi
+        if wdi is None:
+            wdi = read_wdi(WDI_FILES)
+        return wdi
+
+    fig_migracion, fig_crecimiento = get_figures('migracion', WDI_FILES, lambda: create_migracion_charts(load_wdi()),
+                                                 builder=create_migracion_charts)
+    fig_pib = get_figures('pib', WDI_FILES, lambda: create_pib_chart(load_wdi()), builder=create_pib_chart)[0]
+    fig_tipos_vivienda, fig_fuentes_vivienda = get_figures(
+        'composicion', ['composicion.csv'], lambda: create_composicion_charts(pd.read_csv('composicion.csv')),
+        builder=create_composicion_charts)
+    return {
+        'fig_migracion': fig_migracion,
+        'fig_crecimiento': fig_crecimiento,
+        'fig_pib': fig_pib,
+        'fig_tipos_vivienda': fig_tipos_vivienda,
+        'fig_fuentes_vivienda': fig_fuentes_vivienda,
+    }
+
+
+def _digest(*parts):
+    payload = json.dumps([CACHE_VERSION, *parts], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _write_atomic(path, write):
+    tmp_path = tmp_path_for(path)
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def render_figure(spec, path, fmt):
+    # Se ejecuta en un proceso del pool: cada exportación de kaleido es de un solo hilo
+    fig = pio.from_json(json.dumps(spec), skip_invalid=True)
+    if fmt == 'html':
+        _write_atomic(path, lambda tmp: fig.write_html(tmp, include_plotlyjs='cdn'))
+    else:
+        _write_atomic(path, lambda tmp: fig.write_image(tmp, format=fmt, width=ANCHO, height=ALTO, scale=ESCALA))
+    return path
+
+
+def map_inputs(listados_path='precios_clean.csv'):
+    return {
+        'services': geometry_version('beijing_services.geojson'),
+        'metro': geometry_version('beijing_metro.geojson'),
+        'listados': dataset_version(listados_path),
+        'config': config_mapa,
+        'max_features': MAX_FEATURES_MAPA,
+        'arrow': TRANSPORTE_BINARIO,
+    }
+
+
+def render_map(path, listados_path='precios_clean.csv'):
+    """Instantánea HTML del mapa con la vista y las capas por defecto del dashboard."""
+    map_state = config_mapa['config']['mapState']
+    bounds = viewport_bounds(map_state, height=ALTO)
+    layers = {
+        'ecbukq': read_level('beijing_services.geojson', map_state['zoom']),
+        '-kgmb4t': read_geometries('beijing_metro.geojson', derived=False),
+        '-42kwdt': read_current(listados_path, columns=COLUMNAS_MAPA),
+    }
+    layers = {name: SpatialIndex(data).cull(data, bounds, MAX_FEATURES_MAPA.get(name))
+              for name, data in layers.items()}
+    kepler_map = build_kepler_map(layers, height=ALTO)
+    page = kepler_map._repr_html_()
+    if isinstance(page, str):
+        page = page.encode('utf-8')
+
+    def write(tmp):
+        with open(tmp, 'wb') as f:
+            f.write(page)
+
+    _write_atomic(path, write)
+    return path
+
+
+def write_index(output_dir, artifacts):
+    # Página índice del informe con las imágenes y enlaces a las versiones interactivas
+    sections = []
+    for name, files in artifacts.items():
+        title = html.escape(TITULOS.get(name, name))
+        links = ' · '.join(f'<a href="{html.escape(f)}">{os.path.splitext(f)[1][1:].upper()}</a>' for f in files)
+        image = next((f for f in files if f.endswith('.svg')), None) or next((f for f in files if f.endswith('.png')), None)
+        body = f'<img src="{html.escape(image)}" alt="{title}" style="max-width:100%">' if image else ''
+        sections.append(f'<section><h2>{title}</h2>{body}<p>{links}</p></section>')
+    page = ('<!DOCTYPE html><html lang="es"><head><meta charset="utf-8">'
+            '<title>Análisis Contextual del Mercado Inmobiliario de Pekín</title></head><body>'
+            '<h1>Análisis Contextual del Mercado Inmobiliario de Pekín</h1>'
+            f'<p>Generado el {time.strftime("%Y-%m-%d %H:%M")}</p>{"".join(sections)}</body></html>')
+
+    def write(tmp):
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(page)
+
+    _write_atomic(os.path.join(output_dir, 'index.html'), write)
+
+
+def export_report(output_dir='informe', formats=FORMATOS, workers=None, include_map=True, force=False):
+    """Exporta figuras y mapa a `output_dir` en paralelo, saltando lo que no ha cambiado.
+
+    El manifiesto guarda el hash de las entradas de cada artefacto (spec de la figura,
+    formato y tamaño; versiones de los datos y config del mapa). Devuelve
+    {'written': [...], 'skipped': [...], 'seconds': ...}.
+    """
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, 'manifest.json')
+    manifest = read_meta(manifest_path) or {}
+    if manifest.get('version') != CACHE_VERSION:
+        manifest = {'version': CACHE_VERSION, 'artifacts': {}}
+
+    jobs = []
+    artifacts = {}
+    for name, spec in figure_specs().items():
+        for fmt in formats:
+            file_name = f'{name}.{fmt}'
+            digest = _digest(spec, fmt, ANCHO, ALTO, ESCALA)
+            artifacts.setdefault(name, []).append(file_name)
+            jobs.append((file_name, digest, render_figure, (spec, os.path.join(output_dir, file_name), fmt)))
+    if include_map:
+        artifacts['mapa'] = ['mapa.html']
+        # El mapa es el artefacto más lento: se encola el primero
+        jobs.insert(0, ('mapa.html', _digest(map_inputs(), ALTO), render_map, (os.path.join(output_dir, 'mapa.html'),)))
+
+    pending = [job for job in jobs if force or manifest['artifacts'].get(job[0]) != job[1]
+               or not os.path.exists(os.path.join(output_dir, job[0]))]
+    written = []
+    failed = {}
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            futures = {executor.submit(fn, *args): (file_name, digest) for file_name, digest, fn, args in pending}
+            # Cada artefacto se registra al terminar; un fallo no impide registrar los demás
+            for future in as_completed(futures):
+                file_name, digest = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    failed[file_name] = e
+                    continue
+                manifest['artifacts'][file_name] = digest
+                written.append(file_name)
+        write_meta(manifest_path, manifest)
+
+    write_index(output_dir, {name: [f for f in files if f not in failed] for name, files in artifacts.items()})
+    if failed:
+        details = '; '.join(f'{name}: {error}' for name, error in failed.items())
+        raise RuntimeError(f'No se pudieron exportar {len(failed)} artefactos ({details})')
+    skipped = [job[0] for job in jobs if job[0] not in written]
+    return {'written': written, 'skipped': skipped, 'seconds': time.perf_counter() - start}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exporta las figuras y el mapa del dashboard como informe estático.')
+    parser.add_argument('--output', default='informe', help='Directorio del informe')
+    parser.add_argument('--formats', nargs='+', choices=FORMATOS, default=list(FORMATOS))
+    parser.add_argument('--workers', type=int, default=None, help='Procesos del pool (por defecto, núcleos)')
+    parser.add_argument('--no-map', action='store_true', help='No exportar el mapa')
+    parser.add_argument('--force', action='store_true', help='Regenerar aunque las entradas no hayan cambiado')
+    args = parser.parse_args()
+    result = export_report(args.output, args.formats, args.workers, not args.no_map, args.force)
+    print(f"{len(result['written'])} artefactos generados, {len(result['skipped'])} sin cambios "
+          f"en {result['seconds']:.1f} s")
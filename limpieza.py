@@ -0,0 +1,215 @@
+import argparse
+import os
+import shutil
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from artefactos import cache_path, tmp_path_for, write_meta
+from cubo import bucket_of, bucket_value
+from espacial import BOUNDS_PEKIN
+from listados import CHUNK_ROWS
+
+
+# Columnas que tienen que ser numéricas en el volcado; lo que no se pueda convertir queda a NaN
+COLUMNAS_NUMERICAS = [
+    'Lng', 'Lat', 'price', 'totalPrice', 'square', 'DOM', 'followers', 'livingRoom', 'drawingRoom',
+    'kitchen', 'bathRoom', 'constructionTime', 'buildingType', 'renovationCondition', 'buildingStructure',
+    'ladderRatio', 'elevator', 'fiveYearsProperty', 'subway', 'communityAverage',
+]
+
+# Sin estas columnas el anuncio no se puede dibujar ni colorear
+COLUMNAS_OBLIGATORIAS = ('price', 'Lng', 'Lat')
+
+# Cuantiles de precio por distrito fuera de los cuales un anuncio se considera atípico
+CUANTILES_RECORTE = (0.005, 0.995)
+
+# Distritos con menos anuncios no se recortan: sus cuantiles no son fiables
+MIN_ANUNCIOS_DISTRITO = 50
+
+# Redondeo de coordenadas (~10 m) para detectar anuncios republicados en el mismo sitio
+DECIMALES_UBICACION = 4
+
+# Reglas en el orden en que se aplican; el informe cuenta las filas eliminadas por cada una
+REGLAS = ('tipos', 'fuera_de_pekin', 'valor_no_positivo', 'duplicado_id', 'duplicado_url',
+          'duplicado_ubicacion_precio', 'atipico_distrito')
+
+
+class _Vistos:
+    """Hashes (uint64) de las claves ya vistas en bloques anteriores, en un array ordenado.
+
+    8 bytes por clave única: la memoria no depende del tamaño de las filas.
+    """
+
+    def __init__(self):
+        self._hashes = np.empty(0, dtype=np.uint64)
+
+    def first_seen(self, hashes):
+        # Primera aparición dentro del bloque y ausente en los bloques anteriores
+        first = ~pd.Series(hashes).duplicated().to_numpy()
+        pos = np.searchsorted(self._hashes, hashes)
+        found = np.zeros(len(hashes), dtype=bool)
+        inside = pos < len(self._hashes)
+        found[inside] = self._hashes[pos[inside]] == hashes[inside]
+        keep = first & ~found
+        self._hashes = np.sort(np.concatenate([self._hashes, hashes[keep]]))
+        return keep
+
+
+def _hash(values):
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+
+def coerce_raw(chunk):
+    chunk = chunk.copy()
+    for column in COLUMNAS_NUMERICAS:
+        if column in chunk.columns:
+            chunk[column] = pd.to_numeric(chunk[column], errors='coerce')
+    if 'tradeTime' in chunk.columns:
+        chunk['tradeTime'] = pd.to_datetime(chunk['tradeTime'], errors='coerce').dt.strftime('%Y-%m-%d')
+    return chunk
+
+
+def _district_key(chunk):
+    if 'district' not in chunk.columns:
+        return pd.Series('', index=chunk.index)
+    return chunk['district'].astype('string').fillna('')
+
+
+def clean_chunk(chunk, vistos, dropped):
+    """Aplica las reglas fila a fila de REGLAS (todas menos el recorte por distrito) a un bloque."""
+    chunk = coerce_raw(chunk)
+
+    def keep(mask, rule):
+        dropped[rule] += int(len(mask) - np.count_nonzero(mask))
+        return chunk[mask]
+
+    required = [c for c in COLUMNAS_OBLIGATORIAS if c in chunk.columns]
+    chunk = keep(chunk[required].notna().all(axis=1).to_numpy(), 'tipos')
+
+    minx, miny, maxx, maxy = BOUNDS_PEKIN
+    chunk = keep((chunk['Lng'].between(minx, maxx) & chunk['Lat'].between(miny, maxy)).to_numpy(), 'fuera_de_pekin')
+
+    positive = chunk['price'] > 0
+    for column in ('totalPrice', 'square'):
+        if column in chunk.columns:
+            positive &= ~(chunk[column] <= 0)
+    chunk = keep(positive.to_numpy(), 'valor_no_positivo')
+
+    # Un anuncio republicado conserva el id o la URL: se queda la primera aparición
+    for column, rule in (('id', 'duplicado_id'), ('url', 'duplicado_url')):
+        if column in chunk.columns:
+            values = chunk[column].astype('string')
+            mask = np.ones(len(chunk), dtype=bool)
+            present = values.notna().to_numpy()
+            mask[present] = vistos[column].first_seen(_hash(values[present]))
+            chunk = keep(mask, rule)
+
+    # Republicado con otro id: misma ubicación, precio dentro del 1 % y misma superficie
+    location = pd.DataFrame({
+        'lng': chunk['Lng'].round(DECIMALES_UBICACION),
+        'lat': chunk['Lat'].round(DECIMALES_UBICACION),
+        'price': bucket_of(chunk['price'].to_numpy(dtype=np.float64)),
+    })
+    if 'square' in chunk.columns:
+        location['square'] = chunk['square'].round()
+    chunk = keep(vistos['ubicacion'].first_seen(_hash(location)), 'duplicado_ubicacion_precio')
+    chunk['price'] = chunk['price'].round().astype('int64')
+    return chunk
+
+
+def _district_bounds(sketch, quantiles=CUANTILES_RECORTE, min_rows=MIN_ANUNCIOS_DISTRITO):
+    # Cuantiles aproximados (error relativo del 1 %) a partir de los recuentos por cubo logarítmico
+    counts = sketch.sort_index()
+    bounds = {}
+    for district, group in counts.groupby(level=0):
+        total = group.sum()
+        if total < min_rows:
+            continue
+        cumulative = group.cumsum().to_numpy()
+        buckets = group.index.get_level_values(1).to_numpy()
+        low = buckets[np.searchsorted(cumulative, quantiles[0] * total)]
+        high = buckets[np.searchsorted(cumulative, quantiles[1] * total)]
+        bounds[district] = (bucket_value(np.array([low]))[0], bucket_value(np.array([high]))[0])
+    return bounds
+
+
+def clean_listings(raw_path, output_path='precios_clean.csv', chunk_rows=CHUNK_ROWS, encoding=None):
+    """Genera precios_clean a partir del volcado bruto en dos pasadas por bloques.
+
+    1. Tipos, límites de Pekín, valores no positivos y duplicados; los bloques limpios se
+       guardan en Parquet y se acumula un sketch de precios por distrito.
+    2. Recorte de atípicos con los cuantiles de su distrito y escritura del CSV.
+
+    Devuelve el informe con las filas leídas, escritas y eliminadas por regla.
+    """
+    name = os.path.splitext(os.path.basename(output_path))[0]
+    parts_dir = tmp_path_for(os.path.join(os.path.dirname(cache_path('limpieza', 'x')), f'{name}.parts'))
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    os.makedirs(parts_dir)
+
+    dropped = Counter({rule: 0 for rule in REGLAS})
+    vistos = {'id': _Vistos(), 'url': _Vistos(), 'ubicacion': _Vistos()}
+    sketch = None
+    rows_in = 0
+    parts = []
+    try:
+        reader = pd.read_csv(raw_path, dtype={'url': 'string', 'id': 'string', 'Cid': 'string'},
+                             chunksize=chunk_rows, encoding=encoding, low_memory=False)
+        for i, chunk in enumerate(reader):
+            rows_in += len(chunk)
+            chunk = clean_chunk(chunk, vistos, dropped)
+            if not len(chunk):
+                continue
+            counts = pd.Series(1, index=[_district_key(chunk).to_numpy(),
+                                         bucket_of(chunk['price'].to_numpy(dtype=np.float64))]).groupby(level=[0, 1]).sum()
+            sketch = counts if sketch is None else sketch.add(counts, fill_value=0)
+            part_path = os.path.join(parts_dir, f'part-{i:05d}.parquet')
+            chunk.to_parquet(part_path, index=False)
+            parts.append(part_path)
+
+        bounds = _district_bounds(sketch) if sketch is not None else {}
+        tmp_path = tmp_path_for(output_path)
+        rows_out = 0
+        first = True
+        for part_path in parts:
+            chunk = pd.read_parquet(part_path)
+            district = _district_key(chunk)
+            low = district.map({d: b[0] for d, b in bounds.items()}).astype('float64').fillna(-np.inf)
+            high = district.map({d: b[1] for d, b in bounds.items()}).astype('float64').fillna(np.inf)
+            mask = chunk['price'].between(low, high).to_numpy()
+            dropped['atipico_distrito'] += int(len(mask) - np.count_nonzero(mask))
+            chunk = chunk[mask]
+            chunk.to_csv(tmp_path, mode='w' if first else 'a', header=first, index=False)
+            first = False
+            rows_out += len(chunk)
+        if first:
+            pd.DataFrame().to_csv(tmp_path, index=False)
+        os.replace(tmp_path, output_path)
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+    report = {
+        'source': raw_path,
+        'output': output_path,
+        'rows_in': rows_in,
+        'rows_out': rows_out,
+        'dropped': dict(dropped),
+        'district_bounds': {d: [round(float(lo)), round(float(hi))] for d, (lo, hi) in bounds.items()},
+    }
+    write_meta(cache_path('limpieza', f'{name}.report.json'), report)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Limpia y deduplica el volcado de anuncios y genera precios_clean.csv.')
+    parser.add_argument('raw', help='CSV bruto de anuncios')
+    parser.add_argument('--output', default='precios_clean.csv')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--encoding', default=None, help='p. ej. gbk para el volcado original de Lianjia')
+    args = parser.parse_args()
+    report = clean_listings(args.raw, args.output, args.chunk_rows, args.encoding)
+    print(f"{report['rows_in']} filas leídas, {report['rows_out']} escritas")
+    for rule, rows in report['dropped'].items():
+        print(f'  {rule}: {rows}')
@@ -0,0 +1,199 @@
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from artefactos import cache_path, file_stamp, is_fresh, read_meta, source_meta, tmp_path_for, write_meta
+
+
+# Columnas que usan la capa de precios de Kepler y sus tooltips; es una capa de puntos sobre
+# Lng/Lat, sin columna de geometría (mapa.config_for_layers)
+COLUMNAS_MAPA = ['price', 'Lng', 'Lat', 'url', 'id', 'Cid']
+
+# Tipos compactos para el fichero de listados
+DTYPES_LISTADOS = {
+    'url': 'string',
+    'id': 'string',
+    'Lng': 'float32',
+    'Lat': 'float32',
+    'Cid': 'category',
+    'district': 'category',
+}
+
+# Por encima de este tamaño el CSV se ingiere por bloques en un almacén particionado
+STREAMING_THRESHOLD = int(os.environ.get('DASHBOARD_STREAMING_BYTES', 512 * 1024 * 1024))
+CHUNK_ROWS = 500_000
+PARTICIONES = ('district', 'year')
+
+CACHE_VERSION = 2
+
+
+def _cache_paths(file_path):
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return cache_path('listados', f'{name}.parquet'), cache_path('listados', f'{name}.meta.json')
+
+
+def _dataset_paths(file_path):
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    meta_path = cache_path('listados', f'{name}.dataset.meta.json')
+    return os.path.join(os.path.dirname(meta_path), f'{name}.dataset'), meta_path
+
+
+def is_partitioned(file_path):
+    # Por encima de STREAMING_THRESHOLD los listados viven en el almacén particionado
+    return file_stamp(file_path)['size'] > STREAMING_THRESHOLD
+
+
+def _partition_value(value):
+    return int(value) if value.lstrip('-').isdigit() else value
+
+
+def coerce_listados(df, categorical=True):
+    # Sin coordenadas o sin precio el punto no se puede dibujar ni colorear en el mapa
+    df = df.dropna(subset=[c for c in ('price', 'Lng', 'Lat') if c in df.columns]).copy()
+    for column, dtype in DTYPES_LISTADOS.items():
+        if column in df.columns:
+            # Cada bloque del modo streaming tendría sus propias categorías: ahí se guardan como texto
+            df[column] = df[column].astype(dtype if categorical or dtype != 'category' else 'string')
+    if 'price' in df.columns:
+        df['price'] = pd.to_numeric(df['price'], downcast='integer').astype('int32')
+    if 'tradeTime' in df.columns:
+        df['year'] = pd.to_datetime(df['tradeTime'], errors='coerce').dt.year.fillna(0).astype('int16')
+    return df.reset_index(drop=True)
+
+
+def build_listados_cache(file_path):
+    parquet_path, meta_path = _cache_paths(file_path)
+    df = pd.read_csv(file_path, dtype={'url': 'string', 'id': 'string', 'Cid': 'string'}, low_memory=False)
+    df = coerce_listados(df)
+    tmp_path = tmp_path_for(parquet_path)
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, parquet_path)
+    write_meta(meta_path, source_meta(file_path, version=CACHE_VERSION, rows=len(df)))
+    return parquet_path
+
+
+def iter_listados(file_path, chunk_rows=CHUNK_ROWS, filters=()):
+    """Generador de bloques tipados de tamaño acotado; filters son funciones df -> máscara booleana."""
+    reader = pd.read_csv(file_path, dtype={'url': 'string', 'id': 'string', 'Cid': 'string'},
+                         chunksize=chunk_rows, low_memory=False)
+    for chunk in reader:
+        chunk = coerce_listados(chunk, categorical=False)
+        for keep in filters:
+            chunk = chunk[keep(chunk)]
+        if len(chunk):
+            yield chunk.reset_index(drop=True)
+
+
+def build_partitioned_store(file_path, chunk_rows=CHUNK_ROWS, filters=()):
+    """Ingiere el CSV por bloques en un dataset Parquet particionado (district/year)."""
+    root, meta_path = _dataset_paths(file_path)
+    tmp_root = tmp_path_for(root)
+    shutil.rmtree(tmp_root, ignore_errors=True)
+    rows = 0
+    partition_cols = None
+    for i, chunk in enumerate(iter_listados(file_path, chunk_rows, filters)):
+        if partition_cols is None:
+            partition_cols = [c for c in PARTICIONES if c in chunk.columns]
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        pq.write_to_dataset(table, tmp_root, partition_cols=partition_cols,
+                            basename_template=f'part-{i:05d}-{{i}}.parquet')
+        rows += len(chunk)
+
+    old_root = f'{root}.old'
+    shutil.rmtree(old_root, ignore_errors=True)
+    if os.path.exists(root):
+        os.replace(root, old_root)
+    if rows:
+        os.replace(tmp_root, root)
+    shutil.rmtree(old_root, ignore_errors=True)
+    write_meta(meta_path, source_meta(file_path, version=CACHE_VERSION, rows=rows,
+                                      partitions=partition_cols or []))
+    return root
+
+
+def read_partitions(file_path, columns=COLUMNAS_MAPA, filters=None):
+    """Lee del almacén particionado solo las particiones y columnas necesarias.
+
+    filters usa la sintaxis de pyarrow, p. ej. [('district', '=', 7), ('year', '>=', 2015)].
+    """
+    root, _ = _dataset_paths(file_path)
+    ensure_listados_cache(file_path)
+    if not os.path.exists(root):
+        return pd.DataFrame(columns=list(columns) if columns is not None else None)
+    df = pd.read_parquet(root, columns=list(columns) if columns is not None else None, filters=filters)
+    for column, dtype in DTYPES_LISTADOS.items():
+        if column in df.columns:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def partition_values(file_path):
+    """{columna de partición: valores} del almacén, leídos de los nombres de directorio sin abrir datos."""
+    root, _ = _dataset_paths(file_path)
+    ensure_listados_cache(file_path)
+    values = {column: set() for column in PARTICIONES}
+    for _, dirnames, _ in os.walk(root):
+        for dirname in dirnames:
+            column, sep, value = dirname.partition('=')
+            if sep and column in values:
+                values[column].add(_partition_value(value))
+    return {column: sorted(found, key=lambda v: (isinstance(v, str), v)) for column, found in values.items()}
+
+
+def iter_batches(file_path, columns=COLUMNAS_MAPA, batch_rows=CHUNK_ROWS):
+    """Recorre la caché de listados (fichero Parquet o almacén particionado) por lotes tipados.
+
+    Para acumular agregados sin tener la tabla entera en memoria.
+    """
+    ensure_listados_cache(file_path)
+    if is_partitioned(file_path):
+        root, _ = _dataset_paths(file_path)
+        if not os.path.exists(root):
+            return
+        dataset = ds.dataset(root, format='parquet', partitioning='hive')
+    else:
+        parquet_path, _ = _cache_paths(file_path)
+        dataset = ds.dataset(parquet_path, format='parquet')
+    names = None if columns is None else [c for c in columns if c in dataset.schema.names]
+    for batch in dataset.to_batches(columns=names, batch_size=batch_rows):
+        if not batch.num_rows:
+            continue
+        df = batch.to_pandas()
+        for column, dtype in DTYPES_LISTADOS.items():
+            if column in df.columns:
+                df[column] = df[column].astype(dtype)
+        yield df
+
+
+def ensure_listados_cache(file_path):
+    """Reconstruye la caché (fichero Parquet o almacén particionado) si el CSV ha cambiado y devuelve su meta."""
+    streaming = is_partitioned(file_path)
+    if streaming:
+        target, meta_path = _dataset_paths(file_path)
+    else:
+        target, meta_path = _cache_paths(file_path)
+    fresh, meta = is_fresh(file_path, meta_path)
+    if not fresh or meta.get('version') != CACHE_VERSION or (not streaming and not os.path.exists(target)):
+        if streaming:
+            build_partitioned_store(file_path)
+        else:
+            build_listados_cache(file_path)
+        meta = read_meta(meta_path)
+    return meta
+
+
+def read_listados(file_path, columns=COLUMNAS_MAPA, filters=None):
+    """Lee los listados desde la caché Parquet, reconstruyéndola si el CSV ha cambiado.
+
+    Los CSV mayores que STREAMING_THRESHOLD no se cargan enteros: se ingieren por bloques
+    y se consultan con filtros y columnas empujados al almacén particionado.
+    """
+    if is_partitioned(file_path):
+        return read_partitions(file_path, columns, filters)
+    parquet_path, _ = _cache_paths(file_path)
+    ensure_listados_cache(file_path)
+    return pd.read_parquet(parquet_path, columns=list(columns) if columns is not None else None, filters=filters)
@@ -0,0 +1,427 @@
+import copy
+import inspect
+import os
+
+import geopandas as gpd
+from keplergl import KeplerGl
+
+from rendimiento import medir
+
+
+# --- Configuración del mapa de Kepler.gl ---
+config_mapa = {
+    "version": "v1",
+    "config": {
+        "visState": {
+            "filters": [],
+            "layers": [
+                {
+                    "id": "ju8rai",
+                    "type": "geojson",
+                    "config": {
+                        "dataId": "-42kwdt",
+                        "columnMode": "geojson",
+                        "label": "precios_clean",
+                        "color": [130, 154, 227],
+                        "highlightColor": [252, 242, 26, 255],
+                        "columns": {"geojson": "geometry"},
+                        "isVisible": True,
+                        "visConfig": {
+                            "opacity": 0.8,
+                            "strokeOpacity": 0.8,
+                            "thickness": 3.4,
+                            "strokeColor": None,
+                            "colorRange": {
+                                "colors": ["#F7F4F9", "#DCC9E2", "#D08AC2", "#E33890", "#B70B4F", "#67001F"],
+                                "name": "PuRd",
+                                "type": "sequential",
+                                "category": "ColorBrewer"
+                            },
+                            "strokeColorRange": {
+                                "name": "Global Warming",
+                                "type": "sequential",
+                                "category": "Uber",
+                                "colors": ["#4C0035", "#880030", "#B72F15", "#D6610A", "#EF9100", "#FFC300"]
+                            },
+                            "radius": 13.7,
+                            "sizeRange": [0, 10],
+                            "radiusRange": [0, 50],
+                            "heightRange": [0, 500],
+                            "elevationScale": 5,
+                            "stroked": False,
+                            "filled": True,
+                            "enable3d": False,
+                            "wireframe": False,
+                            "fixedHeight": False
+                        },
+                        "hidden": False,
+                        "textLabel": [
+                            {
+                                "field": None,
+                                "color": [255, 255, 255],
+                                "size": 18,
+                                "offset": [0, 0],
+                                "anchor": "start",
+                                "alignment": "center",
+                                "outlineWidth": 0,
+                                "outlineColor": [255, 0, 0, 255],
+                                "background": False,
+                                "backgroundColor": [0, 0, 200, 255]
+                            }
+                        ]
+                    },
+                    "visualChannels": {
+                        "colorField": {"name": "price", "type": "integer"},
+                        "colorScale": "quantize",
+                        "strokeColorField": None,
+                        "strokeColorScale": "quantile",
+                        "sizeField": None,
+                        "sizeScale": "linear",
+                        "heightField": None,
+                        "heightScale": "linear",
+                        "radiusField": None,
+                        "radiusScale": "linear"
+                    }
+                },
+                {
+                    "id": "92v23lj",
+                    "type": "geojson",
+                    "config": {
+                        "dataId": "ecbukq",
+                        "columnMode": "geojson",
+                        "label": "beijing_services",
+                        "color": [246, 209, 138],
+                        "highlightColor": [252, 242, 26, 255],
+                        "columns": {"geojson": "_geojson"},
+                        "isVisible": True,
+                        "visConfig": {
+                            "opacity": 0.77,
+                            "strokeOpacity": 0.8,
+                            "thickness": 2.1,
+                            "strokeColor": [36, 115, 189],
+                            "colorRange": {
+                                "colors": ["#EE7733", "#0077BB", "#33BBEE", "#EE3377", "#CC3311", "#009988"],
+                                "name": "Tol Vibrant",
+                                "type": "qualitative",
+                                "category": "ColorBlind"
+                            },
+                            "strokeColorRange": {
+                                "name": "Global Warming",
+                                "type": "sequential",
+                                "category": "Uber",
+                                "colors": ["#4C0035", "#880030", "#B72F15", "#D6610A", "#EF9100", "#FFC300"]
+                            },
+                            "radius": 0,
+                            "sizeRange": [0, 10],
+                            "radiusRange": [0, 50],
+                            "heightRange": [0, 500],
+                            "elevationScale": 5,
+                            "stroked": False,
+                            "filled": True,
+                            "enable3d": False,
+                            "wireframe": False,
+                            "fixedHeight": False
+                        },
+                        "hidden": False,
+                        "textLabel": [
+                            {
+                                "field": None,
+                                "color": [255, 255, 255],
+                                "size": 18,
+                                "offset": [0, 0],
+                                "anchor": "start",
+                                "alignment": "center",
+                                "outlineWidth": 0,
+                                "outlineColor": [255, 0, 0, 255],
+                                "background": False,
+                                "backgroundColor": [0, 0, 200, 255]
+                            }
+                        ]
+                    },
+                    "visualChannels": {
+                        "colorField": {"name": "amenity", "type": "string"},
+                        "colorScale": "ordinal",
+                        "strokeColorField": None,
+                        "strokeColorScale": "quantile",
+                        "sizeField": None,
+                        "sizeScale": "linear",
+                        "heightField": None,
+                        "heightScale": "linear",
+                        "radiusField": None,
+                        "radiusScale": "linear"
+                    }
+                },
+                {
+                    "id": "2hrwpmd",
+                    "type": "geojson",
+                    "config": {
+                        "dataId": "-kgmb4t",
+                        "columnMode": "geojson",
+                        "label": "beijing_metro",
+                        "color": [87, 57, 33],
+                        "highlightColor": [252, 242, 26, 255],
+                        "columns": {"geojson": "_geojson"},
+                        "isVisible": True,
+                        "visConfig": {
+                            "opacity": 0.8,
+                            "strokeOpacity": 0.8,
+                            "thickness": 8.9,
+                            "strokeColor": [253, 236, 0],
+                            "colorRange": {
+                                "name": "Global Warming",
+                                "type": "sequential",
+                                "category": "Uber",
+                                "colors": ["#4C0035", "#880030", "#B72F15", "#D6610A", "#EF9100", "#FFC300"]
+                            },
+                            "strokeColorRange": {
+                                "name": "Global Warming",
+                                "type": "sequential",
+                                "category": "Uber",
+                                "colors": ["#4C0035", "#880030", "#B72F15", "#D6610A", "#EF9100", "#FFC300"]
+                            },
+                            "radius": 10,
+                            "sizeRange": [0, 10],
+                            "radiusRange": [0, 50],
+                            "heightRange": [0, 500],
+                            "elevationScale": 0,
+                            "stroked": True,
+                            "filled": True,
+                            "enable3d": False,
+                            "wireframe": False,
+                            "fixedHeight": False
+                        },
+                        "hidden": False,
+                        "textLabel": [
+                            {
+                                "field": None,
+                                "color": [255, 255, 255],
+                                "size": 18,
+                                "offset": [0, 0],
+                                "anchor": "start",
+                                "alignment": "center",
+                                "outlineWidth": 0,
+                                "outlineColor": [255, 0, 0, 255],
+                                "background": False,
+                                "backgroundColor": [0, 0, 200, 255]
+                            }
+                        ]
+                    },
+                    "visualChannels": {
+                        "colorField": None,
+                        "colorScale": "quantile",
+                        "strokeColorField": None,
+                        "strokeColorScale": "quantile",
+                        "sizeField": None,
+                        "sizeScale": "linear",
+                        "heightField": None,
+                        "heightScale": "linear",
+                        "radiusField": None,
+                        "radiusScale": "linear"
+                    }
+                }
+            ],
+            "effects": [],
+            "interactionConfig": {
+                "tooltip": {
+                    "fieldsToShow": {
+                        "-42kwdt": [
+                            {
+                                "name": "Lng",
+                                "format": None
+                            },
+                            {
+                                "name": "Lat",
+                                "format": None
+                            }
+                        ],
+                        "-kgmb4t": [
+                            {
+                                "name": "@id",
+                                "format": None
+                            },
+                            {
+                                "name": "area",
+                                "format": None
+                            },
+                            {
+                                "name": "indoor",
+                                "format": None
+                            },
+                            {
+                                "name": "layer",
+                                "format": None
+                            },
+                            {
+                                "name": "level",
+                                "format": None
+                            }
+                        ],
+                        "ecbukq": [
+                            {
+                                "name": "@id",
+                                "format": None
+                            },
+                            {
+                                "name": "amenity",
+                                "format": None
+                            },
+                            {
+                                "name": "name",
+                                "format": None
+                            },
+                            {
+                                "name": "name:zh",
+                                "format": None
+                            },
+                            {
+                                "name": "name:zh-Hans",
+                                "format": None
+                            }
+                        ],
+                        "3wuqo5": [
+                            {
+                                "name": "url",
+                                "format": None
+                            },
+                            {
+                                "name": "id",
+                                "format": None
+                            },
+                            {
+                                "name": "Lng",
+                                "format": None
+                            },
+                            {
+                                "name": "Lat",
+                                "format": None
+                            },
+                            {
+                                "name": "Cid",
+                                "format": None
+                            }
+                        ]
+                    },
+                    "compareMode": False,
+                    "compareType": "absolute",
+                    "enabled": False
+                },
+                "brush": {"size": 0.5, "enabled": False},
+                "geocoder": {"enabled": False},
+                "coordinate": {"enabled": False}
+            },
+            "layerBlending": "normal",
+            "overlayBlending": "normal",
+            "splitMaps": [],
+            "animationConfig": {"currentTime": None, "speed": 1},
+            "editor": {"features": [], "visible": True}
+        },
+        "mapState": {
+            "bearing": 0,
+            "dragRotate": False,
+            "latitude": 39.92836694172162,
+            "longitude": 116.3764795575669,
+            "pitch": 0,
+            "zoom": 9.827295162832453,
+            "isSplit": False,
+            "isViewportSynced": True,
+            "isZoomLocked": False,
+            "splitMapViewports": []
+        },
+        "mapStyle": {
+            "styleType": "satellite",
+            "topLayerGroups": {},
+            "visibleLayerGroups": {
+                "label": True,
+                "road": True,
+                "border": True,
+                "building": True,
+                "water": True,
+                "land": True,
+                "3d building": False
+            },
+            "threeDBuildingColor": [4.179000818945631, 7.370237807958659, 14.816457448989057],
+            "backgroundColor": [0, 0, 0],
+            "mapStyles": {}
+        },
+        "uiState": {
+            "mapControls": {
+                "mapLegend": {
+                    "active": True,
+                    "settings": {
+                        "position": {"x": 35, "anchorX": "right", "y": 66, "anchorY": "bottom"},
+                        "contentHeight": 351.8125
+                    }
+                }
+            }
+        }
+    }
+}
+
+# Límite de elementos por capa enviados al navegador (None = sin límite)
+MAX_FEATURES_MAPA = {'ecbukq': 5000, '-kgmb4t': None, '-42kwdt': 100000}
+
+
+# Envío de las capas como Arrow/GeoArrow en base64 en lugar de CSV/GeoJSON en texto
+TRANSPORTE_BINARIO = os.environ.get('DASHBOARD_KEPLER_ARROW', '1') == '1'
+
+
+def supports_arrow():
+    return 'use_arrow' in inspect.signature(KeplerGl.add_data).parameters
+
+
+def compact_layer(data):
+    """Copia de la capa con Lng/Lat cuantizadas a float32 (~1 m en Pekín) para reducir el payload.
+
+    Las geometrías se envían tal cual: WKB/GeoArrow y GeoJSON las codifican en float64,
+    así que redondearlas no reduce el tamaño.
+    """
+    data = data.copy()
+    for column in ('Lng', 'Lat'):
+        if column in data.columns:
+            data[column] = data[column].astype('float32')
+    return data
+
+
+def config_for_layers(config, layers):
+    # Los anuncios sueltos van como capa de puntos sobre Lng/Lat, sin columna de geometría: cada
+    # coordenada se envía una vez y en float32. La cuadrícula y la densidad (polígonos) usan la geojson
+    data = layers.get('-42kwdt')
+    if data is None or isinstance(data, gpd.GeoDataFrame):
+        return config
+    config = copy.deepcopy(config)
+    for layer in config['config']['visState']['layers']:
+        if layer['config']['dataId'] == '-42kwdt':
+            layer['type'] = 'point'
+            layer['config']['columnMode'] = 'points'
+            layer['config']['columns'] = {'lat': 'Lat', 'lng': 'Lng', 'altitude': None}
+    return config
+
+
+def config_for_transport(config, layers, use_arrow):
+    # En GeoArrow la geometría llega en la columna 'geometry', no en el '_geojson' que crea Kepler
+    if not use_arrow:
+        return config
+    config = copy.deepcopy(config)
+    geo_ids = {name for name, data in layers.items() if isinstance(data, gpd.GeoDataFrame)}
+    for layer in config['config']['visState']['layers']:
+        columns = layer['config'].get('columns', {})
+        if layer['config']['dataId'] in geo_ids and columns.get('geojson') == '_geojson':
+            columns['geojson'] = layers[layer['config']['dataId']].geometry.name
+    return config
+
+
+def build_kepler_map(layers, config=config_mapa, height=600, use_arrow=None):
+    """KeplerGl con las capas dadas como {dataId: datos}, en el orden de inserción."""
+    layers = {name: data for name, data in layers.items() if data is not None}
+    if use_arrow is None:
+        use_arrow = TRANSPORTE_BINARIO
+    use_arrow = use_arrow and supports_arrow()
+    config = config_for_transport(config_for_layers(config, layers), layers, use_arrow)
+    kepler_map = KeplerGl(height=height, config=config)
+    for name, data in layers.items():
+        with medir(f'kepler:add_data:{name}'):
+            if use_arrow:
+                kepler_map.add_data(data=compact_layer(data), name=name, use_arrow=True)
+            else:
+                kepler_map.add_data(data=compact_layer(data), name=name)
+    return kepler_map
@@ -0,0 +1,79 @@
+import argparse
+import math
+import os
+
+import geopandas as gpd
+import shapely
+
+from artefactos import cache_path, is_fresh, source_meta, tmp_path_for, write_meta
+from espacial import TILE_SIZE
+from geometrias import read_geometries
+
+
+# Niveles de zoom de la pirámide; por encima del último se usa la geometría original
+ZOOM_LEVELS = (8, 10, 12, 14)
+
+# Latitud de referencia (Pekín) para convertir píxeles a grados
+LAT_REFERENCIA = 39.9
+
+CACHE_VERSION = 2
+
+
+def pixel_tolerance(zoom, pixels=0.5, lat=LAT_REFERENCIA):
+    # Grados equivalentes a `pixels` píxeles en pantalla a ese zoom
+    return pixels * 360 / (TILE_SIZE * 2 ** zoom) * math.cos(math.radians(lat))
+
+
+def level_for_zoom(zoom, levels=ZOOM_LEVELS):
+    # Se usa el primer nivel igual o más detallado que el zoom pedido
+    for level in levels:
+        if zoom <= level:
+            return level
+    return None
+
+
+def _paths(file_path):
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return (
+        lambda level: cache_path('piramide', name, f'z{level}.parquet'),
+        cache_path('piramide', name, 'meta.json'),
+    )
+
+
+def build_pyramid(file_path, levels=ZOOM_LEVELS):
+    level_path, meta_path = _paths(file_path)
+    gdf = read_geometries(file_path, derived=False)
+    vertices = {}
+    for level in levels:
+        simplified = gdf.copy()
+        simplified['geometry'] = gdf.geometry.simplify(pixel_tolerance(level), preserve_topology=True)
+        out_path = level_path(level)
+        tmp_path = tmp_path_for(out_path)
+        simplified.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, out_path)
+        vertices[f'z{level}'] = int(shapely.get_num_coordinates(simplified.geometry.values).sum())
+    vertices['original'] = int(shapely.get_num_coordinates(gdf.geometry.values).sum())
+    write_meta(meta_path, source_meta(file_path, version=CACHE_VERSION, levels=list(levels), vertices=vertices))
+    return vertices
+
+
+def read_level(file_path, zoom):
+    """Geometrías simplificadas adecuadas para `zoom`, o las originales si el zoom es muy alto."""
+    level = level_for_zoom(zoom)
+    if level is None:
+        return read_geometries(file_path, derived=False)
+    level_path, meta_path = _paths(file_path)
+    fresh, meta = is_fresh(file_path, meta_path)
+    if not fresh or meta.get('version') != CACHE_VERSION or level not in meta.get('levels', []) \
+            or not os.path.exists(level_path(level)):
+        build_pyramid(file_path)
+    return gpd.read_parquet(level_path(level))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Construye la pirámide de geometrías simplificadas por nivel de zoom.')
+    parser.add_argument('files', nargs='*', default=['beijing_services.geojson'])
+    args = parser.parse_args()
+    for file_path in args.files:
+        vertices = build_pyramid(file_path)
+        print(file_path, vertices)
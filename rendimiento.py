@@ -0,0 +1,155 @@
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+
+# Con la instrumentación desactivada los decoradores devuelven la función original: coste cero
+ENABLED = os.environ.get('DASHBOARD_RENDIMIENTO', '0') == '1'
+
+# Muestras de latencia que se conservan por etapa
+MAX_MUESTRAS = 2000
+
+# Límites superiores (ms) de los cubos del histograma
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, float('inf'))
+
+logger = logging.getLogger('dashboard.rendimiento')
+
+_lock = threading.Lock()
+_latencias = defaultdict(lambda: deque(maxlen=MAX_MUESTRAS))
+_caches = defaultdict(lambda: {'calls': 0, 'misses': 0})
+_payloads = defaultdict(lambda: {'count': 0, 'last_bytes': 0, 'total_bytes': 0})
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+def record_latency(stage, seconds):
+    with _lock:
+        _latencias[stage].append(seconds)
+    logger.debug(json.dumps({'event': 'latency', 'stage': stage, 'ms': round(seconds * 1000, 3)}))
+
+
+def record_bytes(stage, size):
+    if not ENABLED:
+        return
+    with _lock:
+        payload = _payloads[stage]
+        payload['count'] += 1
+        payload['last_bytes'] = size
+        payload['total_bytes'] += size
+    logger.debug(json.dumps({'event': 'payload', 'stage': stage, 'bytes': size}))
+
+
+@contextlib.contextmanager
+def _measure(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_latency(stage, time.perf_counter() - start)
+
+
+def medir(stage):
+    """Context manager que mide la latencia de un bloque."""
+    return _measure(stage) if ENABLED else _NULL_CONTEXT
+
+
+def timed(stage):
+    """Decorador que mide la latencia de cada llamada."""
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record_latency(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def cached_stage(stage, cache_decorator):
+    """Aplica una caché de Streamlit contando aciertos y fallos y midiendo la latencia total.
+
+    El cuerpo de la función solo se ejecuta en un fallo, así que se cuenta ahí; las llamadas
+    se cuentan fuera de la caché.
+    """
+    def decorator(fn):
+        if not ENABLED:
+            return cache_decorator(fn)
+
+        @functools.wraps(fn)
+        def on_miss(*args, **kwargs):
+            with _lock:
+                _caches[stage]['misses'] += 1
+            return fn(*args, **kwargs)
+
+        cached = cache_decorator(on_miss)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _lock:
+                _caches[stage]['calls'] += 1
+            start = time.perf_counter()
+            try:
+                return cached(*args, **kwargs)
+            finally:
+                record_latency(stage, time.perf_counter() - start)
+
+        if hasattr(cached, 'clear'):
+            wrapper.clear = cached.clear
+        return wrapper
+    return decorator
+
+
+def _histogram(samples_ms):
+    counts, _ = np.histogram(samples_ms, bins=(0,) + BUCKETS_MS)
+    return {f'<={b:g}ms' if b != float('inf') else '>10000ms': int(c) for b, c in zip(BUCKETS_MS, counts)}
+
+
+def snapshot():
+    """Estado actual de las métricas de este proceso, serializable a JSON."""
+    with _lock:
+        latencias = {stage: np.array(samples) * 1000 for stage, samples in _latencias.items() if samples}
+        caches = {stage: dict(counts) for stage, counts in _caches.items()}
+        payloads = {stage: dict(values) for stage, values in _payloads.items()}
+
+    stages = {}
+    for stage, samples in sorted(latencias.items()):
+        stages[stage] = {
+            'count': int(samples.size),
+            'mean_ms': round(float(samples.mean()), 3),
+            'p50_ms': round(float(np.percentile(samples, 50)), 3),
+            'p90_ms': round(float(np.percentile(samples, 90)), 3),
+            'p99_ms': round(float(np.percentile(samples, 99)), 3),
+            'max_ms': round(float(samples.max()), 3),
+            'histogram': _histogram(samples),
+        }
+    for stage, counts in caches.items():
+        counts['hits'] = counts['calls'] - counts['misses']
+        counts['hit_rate'] = round(counts['hits'] / counts['calls'], 4) if counts['calls'] else None
+    return {'pid': os.getpid(), 'timestamp': time.time(), 'stages': stages, 'caches': caches, 'payloads': payloads}
+
+
+def export_json(path=None):
+    data = json.dumps(snapshot(), indent=2, sort_keys=True)
+    if path is not None:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(data)
+    return data
+
+
+def reset():
+    with _lock:
+        _latencias.clear()
+        _caches.clear()
+        _payloads.clear()
@@ -0,0 +1,71 @@
+import os
+
+import pandas as pd
+
+from artefactos import cache_path, read_meta, source_version, tmp_path_for, write_meta
+from rendimiento import timed
+
+
+# Ficheros de World Development Indicators que usa el dashboard
+WDI_FILES = ('Migración.csv', 'Crecimiento_urbano.csv', 'Gdp.csv')
+
+COLUMNAS_WDI = ['country', 'country_code', 'indicator', 'indicator_code', 'year', 'value']
+
+CACHE_VERSION = 1
+
+
+def _read_wdi_csv(file_path):
+    with open(file_path, encoding='utf-8-sig') as f:
+        first_line = f.readline()
+    if first_line.startswith('"Data Source"'):
+        # Descarga masiva del Banco Mundial: 4 líneas de cabecera y un año por columna
+        wide = pd.read_csv(file_path, sep=',', skiprows=3)
+    else:
+        # Exportación de DataBank: 'Series Name'/'Series Code', años como '1990 [YR1990]' y pie de página
+        wide = pd.read_csv(file_path, sep=',')
+        wide = wide.dropna(subset=['Country Code'])
+        wide = wide.rename(columns={'Series Name': 'Indicator Name', 'Series Code': 'Indicator Code'})
+
+    id_vars = ['Country Name', 'Country Code', 'Indicator Name', 'Indicator Code']
+    year_columns = [c for c in wide.columns if str(c)[:4].isdigit()]
+    long = wide.melt(id_vars=id_vars, value_vars=year_columns, var_name='year', value_name='value')
+    long.columns = COLUMNAS_WDI
+    long['year'] = long['year'].str[:4].astype('int16')
+    # DataBank marca los huecos con '..'
+    long['value'] = pd.to_numeric(long['value'], errors='coerce')
+    return long.dropna(subset=['value'])
+
+
+@timed('wdi:reshape')
+def build_wdi(files=WDI_FILES):
+    long = pd.concat([_read_wdi_csv(f) for f in files], ignore_index=True)
+    long = long.drop_duplicates(subset=['country_code', 'indicator_code', 'year'], keep='last')
+    for column in ('country', 'country_code', 'indicator', 'indicator_code'):
+        long[column] = long[column].astype('category')
+    return long.sort_values(['indicator_code', 'country_code', 'year']).reset_index(drop=True)
+
+
+def read_wdi(files=WDI_FILES):
+    """Tabla larga (país, indicador, año, valor) con todos los ficheros WDI, persistida en Parquet."""
+    parquet_path = cache_path('wdi', 'wdi.parquet')
+    meta_path = cache_path('wdi', 'wdi.meta.json')
+    version = source_version(*files)
+    meta = read_meta(meta_path)
+    if meta is None or meta.get('version') != CACHE_VERSION or meta.get('sources') != version \
+            or not os.path.exists(parquet_path):
+        long = build_wdi(files)
+        tmp_path = tmp_path_for(parquet_path)
+        long.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, parquet_path)
+        write_meta(meta_path, {'version': CACHE_VERSION, 'sources': version, 'files': list(files), 'rows': len(long)})
+        return long
+    return pd.read_parquet(parquet_path)
+
+
+def wdi_serie(wdi, indicator_code, country_code='CHN', desde=None):
+    mask = (wdi['indicator_code'] == indicator_code) & (wdi['country_code'] == country_code)
+    if desde is not None:
+        mask &= wdi['year'] >= desde
+    serie = wdi.loc[mask, ['year', 'value']].sort_values('year')
+    serie['year'] = serie['year'].astype(int)
+    return serie.reset_index(drop=True)